@@ -0,0 +1,51 @@
+import random
+
+import numpy as np
+
+from simulation import Map, VISIBILITY_INDEX_MAX_BYTES
+
+# -------------------------
+# NumPy-backed Map
+# -------------------------
+class ArrayMap(Map):
+    """
+    Drop-in Map variant that keeps the grid in one contiguous uint8 array.
+    Free flags live in a flat bytearray shared with a boolean NumPy view, so
+    scalar is_free checks stay cheap while batched queries are vectorized.
+    The flat indices of all free cells are computed once up front.
+    """
+    def __init__(self, grid, visibility_max_bytes=VISIBILITY_INDEX_MAX_BYTES):
+        cells = np.array(grid, dtype=np.uint8, order="C")
+        if cells.size == 0:
+            cells = np.zeros((0, 0), dtype=np.uint8)
+        if cells.ndim != 2:
+            raise ValueError("Map grid must be two-dimensional.")
+        super().__init__(cells, visibility_max_bytes)
+        self.height, self.width = cells.shape
+        self._free = bytearray((cells == 0).tobytes())
+        self.free_mask = np.frombuffer(self._free, dtype=np.bool_).reshape(cells.shape)
+        self.free_cells = np.flatnonzero(self.free_mask)
+
+    def is_free(self, x, y):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self._free[y * self.width + x] == 1
+        return False
+
+    def are_free(self, points):
+        """Return a boolean array saying which of the (x, y) points are free."""
+        points = np.asarray(points, dtype=np.intp).reshape(-1, 2)
+        x = points[:, 0]
+        y = points[:, 1]
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        free = np.zeros(len(points), dtype=bool)
+        free[inside] = self.free_mask[y[inside], x[inside]]
+        return free
+
+    def get_random_free_cell(self, rng=random):
+        if len(self.free_cells) == 0:
+            raise ValueError("No free cells available on the map.")
+        y, x = divmod(int(self.free_cells[rng.randrange(len(self.free_cells))]), self.width)
+        return (x, y)
+
+    def to_list(self):
+        return self.grid.tolist()
@@ -0,0 +1,135 @@
+import math
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from simulation import create_map, create_simulation
+
+# -------------------------
+# Worker Side
+# -------------------------
+# Each worker process receives the config once through the pool
+# initializer and builds its Map once, so visibility rows are reused by
+# every run that lands on that worker.
+_worker_config = None
+_worker_map = None
+
+def _init_worker(config):
+    global _worker_config, _worker_map
+    _worker_config = config
+    _worker_map = create_map(config)
+
+def _run_seed(seed):
+    simulation = create_simulation(dict(_worker_config, seed=seed), game_map=_worker_map)
+    result = simulation.run()
+    return {
+        "seed": seed,
+        "attackers_win": result["outcome"]["attackers_win"],
+        "ticks": simulation.tick,
+        "stats": result["stats"],
+    }
+
+# -------------------------
+# Aggregation Helpers
+# -------------------------
+def wilson_interval(successes, n, z=1.96):
+    if n == 0:
+        return (0.0, 0.0)
+    p = successes / n
+    denom = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return (max(0.0, centre - half), min(1.0, centre + half))
+
+# Stats that are -1 when the event never happened in a run (no kill, or
+# never two attackers alive); those runs are counted, not averaged.
+SENTINEL_STATS = (
+    "attacker_first_blood", "defender_first_blood",
+    "spread_avg", "spread_var", "spread_p05", "spread_median", "spread_p95",
+)
+
+def summarize(values, z=1.96):
+    n = len(values)
+    if n == 0:
+        return dict.fromkeys(("mean", "std", "ci_low", "ci_high", "min", "p05", "median", "p95", "max"))
+    mean = statistics.fmean(values)
+    std = statistics.stdev(values) if n > 1 else 0.0
+    half = z * std / math.sqrt(n)
+    if n > 1:
+        cuts = statistics.quantiles(values, n=20, method="inclusive")
+        p05, p50, p95 = cuts[0], statistics.median(values), cuts[-1]
+    else:
+        p05 = p50 = p95 = values[0]
+    return {
+        "mean": mean,
+        "std": std,
+        "ci_low": mean - half,
+        "ci_high": mean + half,
+        "min": min(values),
+        "p05": p05,
+        "median": p50,
+        "p95": p95,
+        "max": max(values),
+    }
+
+def summarize_stat(key, values):
+    if key not in SENTINEL_STATS:
+        return summarize(values)
+    present = [value for value in values if value != -1]
+    summary = summarize(present)
+    summary["missing"] = len(values) - len(present)
+    return summary
+
+def aggregate(runs):
+    wins = sum(1 for run in runs if run["attackers_win"])
+    low, high = wilson_interval(wins, len(runs))
+    # Runs without a recorded final episode (recording "none") have no stats.
+    recorded = [run["stats"] for run in runs if run["stats"] is not None]
+    stats = {
+        key: summarize_stat(key, [run_stats[key] for run_stats in recorded])
+        for key in recorded[0]
+    } if recorded else None
+    return {
+        "runs": len(runs),
+        "attackers_win_rate": wins / len(runs),
+        "attackers_win_ci": [low, high],
+        "ticks": summarize([run["ticks"] for run in runs]),
+        "stats": stats,
+    }
+
+# -------------------------
+# Batch Runner
+# -------------------------
+def run_batch(config, n_runs, workers=None, base_seed=0):
+    """
+    Run n_runs independent Simulation.run() calls of one /simulate config,
+    seeded base_seed, base_seed + 1, ..., spread over a process pool, and
+    return win rates and Statistics.stats() distributions with 95% CIs.
+    """
+    if n_runs < 1:
+        raise ValueError("n_runs must be at least 1.")
+    # Fail fast on bad configs instead of inside every worker.
+    create_simulation(config)
+    workers = int(workers or os.cpu_count() or 1)
+    if workers < 1:
+        raise ValueError("workers must be at least 1.")
+    workers = min(workers, n_runs)
+    seeds = range(base_seed, base_seed + n_runs)
+
+    start = time.perf_counter()
+    if workers == 1:
+        _init_worker(config)
+        runs = [_run_seed(seed) for seed in seeds]
+    else:
+        chunksize = max(1, n_runs // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config,)) as pool:
+            runs = list(pool.map(_run_seed, seeds, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+
+    summary = aggregate(runs)
+    summary["workers"] = workers
+    summary["base_seed"] = base_seed
+    summary["elapsed"] = elapsed
+    summary["runs_per_sec"] = n_runs / elapsed if elapsed > 0 else None
+    return summary
@@ -0,0 +1,370 @@
+"""
+Benchmarks for the simulation backend.
+
+    python bench.py run [--quick] [--engine object,vector] [--output results.json]
+    python bench.py compare baseline.json results.json [--threshold 0.15]
+    python bench.py load --workers 1,2,4 [--concurrency 8] [--requests 48]
+
+run times the hot paths (Simulation.update via play_episode, run_episode,
+Statistics.stats() and POST /simulate) over a fixed-seed matrix of map
+sizes, wall densities, agent counts and max_ticks, and writes the results
+as JSON. compare matches cases by name and exits non-zero when any metric
+got worse by more than the threshold. load sends concurrent /simulate
+requests to a running server (--url), or to gunicorn started with each of
+the given worker counts, and reports throughput and latency.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from simulation import Statistics, create_simulation
+
+# -------------------------
+# Benchmark Matrix
+# -------------------------
+MAP_SIZES = (10, 50, 100, 250, 500)
+WALL_DENSITIES = (0.0, 0.2)
+AGENT_COUNTS = ((2, 3), (10, 10), (50, 50))
+MAX_TICKS = (100, 1000)
+
+QUICK_MAP_SIZES = (10, 50)
+QUICK_AGENT_COUNTS = ((2, 3), (10, 10))
+QUICK_MAX_TICKS = (100,)
+
+# /simulate trains NUM_EPISODES episodes per request, so it is only timed on small maps.
+ENDPOINT_MAX_SIZE = 100
+
+# Metrics where larger is better; every other metric is a cost.
+HIGHER_IS_BETTER = ("ticks_per_sec", "episodes_per_sec")
+# Metrics that describe the workload rather than its cost.
+NOT_COMPARED = ("update_ticks",)
+
+def make_config(size, density, attackers, defenders, max_ticks, engine, seed=0):
+    """Fixed-seed /simulate payload: random walls, agents on distinct free cells."""
+    rng = random.Random(f"{size}-{density}-{attackers}-{defenders}-{seed}")
+    grid = [[1 if rng.random() < density else 0 for _ in range(size)] for _ in range(size)]
+    free = [(x, y) for y in range(size) for x in range(size) if grid[y][x] == 0]
+    positions = rng.sample(free, attackers + defenders)
+    return {
+        "grid": grid,
+        "attacker_positions": [list(p) for p in positions[:attackers]],
+        "defender_positions": [list(p) for p in positions[attackers:]],
+        "max_ticks": max_ticks,
+        "engine": engine,
+        "seed": seed,
+    }
+
+def cases(quick=False, engines=("object",)):
+    sizes = QUICK_MAP_SIZES if quick else MAP_SIZES
+    counts = QUICK_AGENT_COUNTS if quick else AGENT_COUNTS
+    ticks = QUICK_MAX_TICKS if quick else MAX_TICKS
+    for engine, size, density, (attackers, defenders), max_ticks in itertools.product(
+            engines, sizes, WALL_DENSITIES, counts, ticks):
+        if attackers + defenders > size * size * (1 - density) / 2:
+            continue
+        name = f"{engine}/{size}x{size}/walls{density}/{attackers}v{defenders}/t{max_ticks}"
+        yield name, make_config(size, density, attackers, defenders, max_ticks, engine)
+
+# -------------------------
+# Measurements
+# -------------------------
+def timed(fn, repeat):
+    """(wall time, return value) of each of repeat calls of fn()."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        runs.append((time.perf_counter() - start, value))
+    return runs
+
+def median_time(runs):
+    return statistics.median(elapsed for elapsed, _ in runs)
+
+def median_rate(runs, count=lambda value: 1):
+    """Median over runs of count(value) / elapsed, so each rate pairs a run's own work and time."""
+    rates = [count(value) / elapsed for elapsed, value in runs if elapsed > 0]
+    return statistics.median(rates) if rates else None
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def bench_case(config, repeat=3, endpoint=None):
+    result = {}
+
+    # Simulation.update: training-only episodes, no snapshots or statistics.
+    simulation = create_simulation(config)
+    def play():
+        simulation.play_episode()
+        return simulation.tick
+    runs = timed(play, repeat)
+    result["update_ticks"] = statistics.median(ticks for _, ticks in runs)
+    result["update_ticks_per_sec"] = median_rate(runs, lambda ticks: ticks)
+
+    # run_episode: recorded episode with streaming statistics.
+    simulation = create_simulation(config)
+    runs = timed(simulation.run_episode, repeat)
+    result["episode_seconds"] = median_time(runs)
+    result["episode_episodes_per_sec"] = median_rate(runs)
+    result["episode_ticks_per_sec"] = median_rate(runs, lambda episode: len(episode["states"]))
+    result["episode_peak_bytes"] = peak_memory(create_simulation(config).run_episode)
+    episode = runs[-1][1]
+
+    # Statistics over the recorded trajectory.
+    result["stats_seconds"] = median_time(timed(lambda: Statistics(episode["states"], simulation.map).stats(), repeat))
+
+    if endpoint is not None and len(config["grid"]) <= ENDPOINT_MAX_SIZE:
+        # Seeded payloads hit the result cache after the first call, so vary the seed.
+        seeds = iter(range(1, repeat + 1))
+        runs = timed(lambda: endpoint.post("/simulate", json=dict(config, seed=next(seeds) + 10 ** 6)), repeat)
+        result["endpoint_seconds"] = median_time(runs)
+        result["endpoint_response_bytes"] = len(runs[-1][1].data)
+        compact = endpoint.post("/simulate", json=dict(config, seed=0, format="compact"))
+        result["endpoint_compact_response_bytes"] = len(compact.data)
+    return result
+
+def run(quick=False, engines=("object",), repeat=3, endpoint=True, name_filter=None, log=sys.stderr):
+    client = None
+    if endpoint:
+        from server import app
+        client = app.test_client()
+    results = {}
+    for name, config in cases(quick, engines):
+        if name_filter and name_filter not in name:
+            continue
+        start = time.perf_counter()
+        try:
+            results[name] = bench_case(config, repeat, client)
+        except Exception as e:
+            # e.g. statistics over an episode that ended on its first tick.
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+        print(f"{name}: {time.perf_counter() - start:.1f}s", file=log)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "quick": quick,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+# -------------------------
+# Regression Check
+# -------------------------
+def compare(baseline, current, threshold=0.15):
+    """
+    Per-metric changes for cases present in both runs. A metric regresses
+    when it is worse than the baseline by more than threshold (relative),
+    and a case that ran in the baseline but errors now is one regression.
+    """
+    rows = []
+    for name, metrics in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        if "error" in metrics and "error" not in base:
+            rows.append({
+                "case": name,
+                "metric": "error",
+                "baseline": None,
+                "current": metrics["error"],
+                "change": None,
+                "regression": True,
+            })
+            continue
+        for metric, value in metrics.items():
+            if metric in NOT_COMPARED:
+                continue
+            old = base.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old == 0:
+                continue
+            change = (value - old) / old
+            higher_better = metric.endswith(HIGHER_IS_BETTER)
+            worse = -change if higher_better else change
+            rows.append({
+                "case": name,
+                "metric": metric,
+                "baseline": old,
+                "current": value,
+                "change": change,
+                "regression": worse > threshold,
+            })
+    return rows
+
+# -------------------------
+# Concurrent Load
+# -------------------------
+def post_simulation(url, config):
+    request = urllib.request.Request(url.rstrip("/") + "/simulate", data=json.dumps(config).encode(),
+                                     headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=600) as response:
+            size = len(response.read())
+            ok = response.status == 200
+    except urllib.error.URLError:
+        size, ok = 0, False
+    return time.perf_counter() - start, size, ok
+
+def load_test(url, config, requests, concurrency):
+    """Send requests /simulate calls, concurrency at a time; every one gets its own seed so none is cached."""
+    base_seed = random.randrange(10 ** 9)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda i: post_simulation(url, dict(config, seed=base_seed + i)), range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latency, _, ok in results if ok)
+    def percentile(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": sum(1 for _, _, ok in results if not ok),
+        "seconds": elapsed,
+        "requests_per_sec": len(latencies) / elapsed,
+        "latency_p50": percentile(0.5),
+        "latency_p95": percentile(0.95),
+        "response_bytes": statistics.mean(size for _, size, ok in results if ok) if latencies else None,
+    }
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(workers, port, timeout=60):
+    """gunicorn with the repo's config and the given worker count; returns once it answers."""
+    env = dict(os.environ, BIND=f"127.0.0.1:{port}", WEB_CONCURRENCY=str(workers), ACCESS_LOG=os.devnull)
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+                               cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1).close()
+            return process
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start in time")
+
+def stop_server(process, timeout=60):
+    # SIGTERM is gunicorn's graceful shutdown.
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def run_load(config, requests, concurrency=None, url=None, workers=(), log=sys.stderr):
+    runs = []
+    if url is not None:
+        runs.append(dict(load_test(url, config, requests, concurrency or 1), workers=None))
+    for count in workers:
+        port = free_port()
+        process = start_server(count, port)
+        try:
+            url_for = f"http://127.0.0.1:{port}"
+            # Warm every worker once before measuring.
+            load_test(url_for, config, count, count)
+            runs.append(dict(load_test(url_for, config, requests, concurrency or 2 * count), workers=count))
+        finally:
+            stop_server(process)
+        print(f"{count} workers: {runs[-1]['requests_per_sec']:.2f} req/s", file=log)
+    if runs:
+        base = runs[0]["requests_per_sec"]
+        for run in runs:
+            run["speedup"] = run["requests_per_sec"] / base if base else None
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "load": runs,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmark matrix")
+    run_parser.add_argument("--quick", action="store_true", help="small maps and agent counts only")
+    run_parser.add_argument("--engine", default="object", help="comma-separated engines to benchmark")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--filter", help="only run cases whose name contains this")
+    run_parser.add_argument("--no-endpoint", action="store_true", help="skip the /simulate benchmark")
+    run_parser.add_argument("--output", help="write results JSON here instead of stdout")
+    compare_parser = commands.add_parser("compare", help="compare results against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.15)
+    load_parser = commands.add_parser("load", help="concurrent /simulate throughput")
+    load_parser.add_argument("--url", help="server to load (default: start gunicorn per --workers count)")
+    load_parser.add_argument("--workers", default="1,2,4", help="comma-separated gunicorn worker counts")
+    load_parser.add_argument("--concurrency", type=int, help="requests in flight (default: twice the workers)")
+    load_parser.add_argument("--requests", type=int, default=48)
+    load_parser.add_argument("--size", type=int, default=30, help="map width and height")
+    load_parser.add_argument("--agents", type=int, default=5, help="attackers and defenders per side")
+    load_parser.add_argument("--max-ticks", type=int, default=200)
+    load_parser.add_argument("--output", help="write results JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.command == "load":
+        config = make_config(args.size, 0.1, args.agents, args.agents, args.max_ticks, "object")
+        workers = () if args.url else tuple(int(count) for count in args.workers.split(","))
+        text = json.dumps(run_load(config, args.requests, args.concurrency, args.url, workers), indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        return 0
+
+    if args.command == "run":
+        results = run(args.quick, tuple(args.engine.split(",")), args.repeat, not args.no_endpoint, args.filter)
+        text = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold)
+    regressions = [row for row in rows if row["regression"]]
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        if row["change"] is None:
+            print(f"{row['case']:<48} {row['metric']:<32} {row['current']} {flag}")
+            continue
+        print(f"{row['case']:<48} {row['metric']:<32} {row['baseline']:>14.6g} {row['current']:>14.6g} {row['change']:>+8.1%} {flag}")
+    print(f"{len(rows)} metrics compared, {len(regressions)} regressions (threshold {args.threshold:.0%})")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
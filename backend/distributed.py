@@ -0,0 +1,195 @@
+import math
+import multiprocessing as mp
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from simulation import RecordingPolicy, create_simulation
+
+# -------------------------
+# Q-Value Packing
+# -------------------------
+ROLES = ("attacker", "defender")
+# Seconds a worker waits at a sync for the others before giving up.
+SYNC_TIMEOUT = 300
+# Seconds between the parent's checks that every worker is still running.
+POLL_SECONDS = 1.0
+
+def flatten_q(arrays):
+    """Concatenate Simulation.get_q_arrays() into one float vector."""
+    parts = [np.asarray(array, dtype=float).ravel() for role in ROLES for array in arrays[role]]
+    return np.concatenate(parts) if parts else np.zeros(0)
+
+def unflatten_q(flat, like):
+    arrays = {}
+    offset = 0
+    for role in ROLES:
+        arrays[role] = []
+        for array in like[role]:
+            shape = np.shape(array)
+            size = int(np.prod(shape))
+            arrays[role].append(flat[offset:offset + size].reshape(shape))
+            offset += size
+    return arrays
+
+# -------------------------
+# Worker Side
+# -------------------------
+# Every worker trains its own seeded Simulation. After each round of
+# sync_every episodes it publishes its Q-values to its row of a shared
+# memory block, waits for the others, and continues from the row average.
+# Each worker computes the same average itself, so there is no learner
+# process and nothing is pickled apart from the final summaries.
+def _train_worker(rank, config, seed, episodes, sync_every, shm_name, shape, barrier, results, sync_timeout):
+    shm = None
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        slots = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        simulation = create_simulation(dict(config, seed=seed))
+        policy = RecordingPolicy("none")
+        summaries = []
+        done = 0
+        while done < episodes:
+            count = min(sync_every, episodes - done)
+            simulation.run_training(count, policy=policy, summaries=True)
+            summaries += [dict(summary, episode=done + summary["episode"]) for summary in simulation.summaries]
+            done += count
+            like = simulation.get_q_arrays()
+            slots[rank] = flatten_q(like)
+            barrier.wait(sync_timeout)
+            merged = slots.mean(axis=0)
+            # Nobody overwrites their row until everyone has read the average.
+            barrier.wait(sync_timeout)
+            simulation.set_q_arrays(unflatten_q(merged, like))
+        results.put((rank, None, summaries))
+    except Exception as e:
+        barrier.abort()
+        results.put((rank, f"{type(e).__name__}: {e}", None))
+    finally:
+        if shm is not None:
+            shm.close()
+
+# -------------------------
+# Distributed Trainer
+# -------------------------
+def _collect(processes, results, barrier):
+    """
+    One (rank, error, summaries) outcome per worker, sorted by rank. Raises
+    RuntimeError as soon as a worker reports an error or exits without
+    reporting, e.g. after being killed, so the others are never left
+    waiting on it.
+    """
+    outcomes = {}
+    exited = set()
+    while len(outcomes) < len(processes):
+        try:
+            rank, error, summaries = results.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            # A worker that exited cleanly may still have its result in
+            # flight, so only give up once it has been gone for a full poll.
+            gone = {rank for rank, process in enumerate(processes)
+                    if process.exitcode is not None and rank not in outcomes}
+            lost = gone & exited
+            if lost:
+                rank = min(lost)
+                barrier.abort()
+                raise RuntimeError(f"Distributed training failed: worker {rank} exited "
+                                   f"with code {processes[rank].exitcode}")
+            exited = gone
+            continue
+        if error is not None:
+            barrier.abort()
+            raise RuntimeError(f"Distributed training failed: {error}")
+        outcomes[rank] = (rank, error, summaries)
+    return [outcomes[rank] for rank in sorted(outcomes)]
+
+def run_distributed(config, num_episodes, workers=None, sync_every=10, base_seed=0, baseline=False,
+                    sync_timeout=SYNC_TIMEOUT):
+    """
+    Train one /simulate config for num_episodes in total, split evenly over
+    local worker processes seeded base_seed, base_seed + 1, ... Workers
+    average their attacker and defender Q-values through shared memory
+    every sync_every episodes. Returns the result of one recorded episode
+    played with the merged Q-values, plus timing; with baseline, the same
+    number of episodes is also trained by a single run_training() call and
+    the wall-clock speedup is reported. A worker that fails, dies or waits
+    more than sync_timeout seconds at a sync stops the whole run with a
+    RuntimeError, and the remaining workers are terminated.
+    """
+    if num_episodes < 1:
+        raise ValueError("num_episodes must be at least 1.")
+    if sync_every < 1:
+        raise ValueError("sync_every must be at least 1.")
+    # Fail fast on bad configs (and sparse tables) instead of inside every worker.
+    simulation = create_simulation(dict(config, seed=base_seed))
+    like = simulation.get_q_arrays()
+    workers = int(workers or os.cpu_count() or 1)
+    if workers < 1:
+        raise ValueError("workers must be at least 1.")
+    workers = min(workers, num_episodes)
+    episodes_per_worker = math.ceil(num_episodes / workers)
+    size = max(1, flatten_q(like).size)
+
+    context = mp.get_context()
+    shm = shared_memory.SharedMemory(create=True, size=workers * size * 8)
+    try:
+        slots = np.ndarray((workers, size), dtype=np.float64, buffer=shm.buf)
+        slots[:] = 0.0
+        barrier = context.Barrier(workers)
+        results = context.Queue()
+        start = time.perf_counter()
+        processes = [
+            context.Process(target=_train_worker,
+                            args=(rank, config, base_seed + rank, episodes_per_worker, sync_every,
+                                  shm.name, (workers, size), barrier, results, sync_timeout))
+            for rank in range(workers)
+        ]
+        try:
+            for process in processes:
+                process.start()
+            outcomes = _collect(processes, results, barrier)
+        except BaseException:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            raise
+        finally:
+            for process in processes:
+                if process.pid is not None:
+                    process.join()
+        elapsed = time.perf_counter() - start
+        merged = slots.mean(axis=0)[:flatten_q(like).size].copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+    simulation.set_q_arrays(unflatten_q(merged, like))
+    result = simulation.run_training(1, policy=RecordingPolicy("last"))
+    total = episodes_per_worker * workers
+    episodes = [
+        {"worker": rank, **summary}
+        for rank, _, summaries in outcomes
+        for summary in summaries
+    ]
+    report = {
+        "result": result,
+        "workers": workers,
+        "episodes": total,
+        "episodes_per_worker": episodes_per_worker,
+        "sync_every": sync_every,
+        "syncs": math.ceil(episodes_per_worker / sync_every),
+        "attackers_win_rate": sum(1 for e in episodes if e["attackers_win"]) / len(episodes),
+        "elapsed": elapsed,
+        "episodes_per_sec": total / elapsed if elapsed > 0 else None,
+    }
+    if baseline:
+        single = create_simulation(dict(config, seed=base_seed))
+        start = time.perf_counter()
+        single.run_training(total, policy=RecordingPolicy("none"))
+        baseline_elapsed = time.perf_counter() - start
+        report["baseline_elapsed"] = baseline_elapsed
+        report["speedup"] = baseline_elapsed / elapsed if elapsed > 0 else None
+    return report
@@ -0,0 +1,32 @@
+import multiprocessing
+import os
+
+# gunicorn -c gunicorn.conf.py wsgi:app
+# Every setting can be overridden from the environment (see README.md).
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+
+# Simulations are CPU-bound, so throughput scales with processes, not threads.
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.getenv('WORKER_THREADS', 1))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Import the app (and warm its tables, see wsgi.py) once, before forking.
+preload_app = True
+
+# Long training runs are legitimate; a worker silent for longer is restarted.
+timeout = int(os.getenv('WORKER_TIMEOUT', 300))
+# On SIGTERM workers stop accepting requests and get this long to finish.
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', 60))
+keepalive = 5
+
+# Recycle workers after this many requests (0 = never) to bound cache growth.
+max_requests = int(os.getenv('MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv('ACCESS_LOG', '-')
+
+def worker_exit(server, worker):
+    # Let running background jobs finish and drop the queued ones.
+    from server import jobs
+    jobs.shutdown(wait=True)
@@ -0,0 +1,166 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# -------------------------
+# Errors
+# -------------------------
+class QueueFull(Exception):
+    pass
+
+class JobCancelled(Exception):
+    pass
+
+# -------------------------
+# Job
+# -------------------------
+class Job:
+    def __init__(self, task):
+        self.id = uuid.uuid4().hex
+        self.task = task
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.future = None
+        self.cancel_requested = threading.Event()
+
+    def checkpoint(self, done, total):
+        # Called by the task between units of work; this is where a
+        # running job notices that it has been cancelled.
+        self.progress = {"done": done, "total": total}
+        if self.cancel_requested.is_set():
+            raise JobCancelled()
+
+    def to_dict(self, include_result=True):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "progress": self.progress,
+        }
+        if self.error is not None:
+            data["error"] = self.error
+        if include_result and self.status == "done":
+            data["result"] = self.result
+        return data
+
+# -------------------------
+# Finished Job Store (LRU + TTL)
+# -------------------------
+class ResultStore:
+    def __init__(self, max_entries=256, ttl=600.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _evict_expired(self, now):
+        # Reads move entries to the end, so expired ones can sit behind fresh ones.
+        expired = [key for key, (stored_at, _) in self.entries.items() if now - stored_at > self.ttl]
+        for key in expired:
+            del self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            now = self.clock()
+            self.entries[key] = (now, value)
+            self.entries.move_to_end(key)
+            self._evict_expired(now)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            self._evict_expired(self.clock())
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def __len__(self):
+        with self.lock:
+            self._evict_expired(self.clock())
+            return len(self.entries)
+
+# -------------------------
+# Job Queue
+# -------------------------
+class JobQueue:
+    """
+    In-process job runner. A fixed thread pool executes tasks; at most
+    max_pending jobs may be queued or running at once, after which submit
+    raises QueueFull. Finished jobs move to a ResultStore and expire from
+    there by LRU order and TTL.
+    """
+    def __init__(self, workers=2, max_pending=16, max_results=256, result_ttl=600.0):
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="simulation-job")
+        self.active = {}
+        self.results = ResultStore(max_results, result_ttl)
+        self.lock = threading.Lock()
+
+    def depth(self):
+        with self.lock:
+            return len(self.active)
+
+    def submit(self, task):
+        """Queue task(job) and return the Job; task should call job.checkpoint periodically."""
+        job = Job(task)
+        with self.lock:
+            if len(self.active) >= self.max_pending:
+                raise QueueFull(f"Job queue is full ({self.max_pending} pending).")
+            self.active[job.id] = job
+        job.future = self.executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        if job.cancel_requested.is_set():
+            self._finish(job, "cancelled")
+            return
+        job.status = "running"
+        job.started = time.time()
+        try:
+            job.result = job.task(job)
+        except JobCancelled:
+            self._finish(job, "cancelled")
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, "failed")
+        else:
+            self._finish(job, "done")
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished = time.time()
+        job.task = None
+        with self.lock:
+            self.active.pop(job.id, None)
+        self.results.put(job.id, job)
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.active.get(job_id)
+        return job if job is not None else self.results.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job. Returns the Job, or None if unknown."""
+        job = self.get(job_id)
+        if job is None or job.status in ("done", "failed", "cancelled"):
+            return job
+        job.cancel_requested.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, "cancelled")
+        return job
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
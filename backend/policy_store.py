@@ -0,0 +1,78 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+ROLES = ("attacker", "defender")
+
+def map_hash(grid):
+    """Stable digest of a map layout (dimensions and wall cells)."""
+    height = len(grid)
+    width = len(grid[0]) if height else 0
+    cells = bytes(int(cell) & 0xFF for row in grid for cell in row)
+    return hashlib.sha256(f"{width}x{height}:".encode() + cells).hexdigest()[:32]
+
+def policy_variant(simulation):
+    # Q-values learned under different state encodings are not interchangeable.
+    if simulation.q_state is None:
+        return "action"
+    encoder = simulation.state_encoder
+    return f"{simulation.q_state}-{encoder.buckets}-{'shared' if simulation.shared_q else 'agent'}"
+
+# -------------------------
+# Policy Store
+# -------------------------
+class PolicyStore:
+    """
+    Learned Q-values on disk, one .npy file per (map hash, role, state
+    encoding). Each file stacks that role's arrays from
+    Simulation.get_q_arrays(); loading memory-maps it, so opening a stored
+    policy costs a page-in of the rows actually read rather than a parse.
+    Writes go through a temporary file and an atomic rename.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, key, role, variant):
+        return os.path.join(self.directory, key, f"{role}-{variant}.npy")
+
+    def save(self, simulation):
+        key = map_hash(simulation.map.to_list())
+        variant = policy_variant(simulation)
+        arrays = simulation.get_q_arrays()
+        os.makedirs(os.path.join(self.directory, key), exist_ok=True)
+        for role in ROLES:
+            stacked = np.stack([np.asarray(array, dtype=np.float64) for array in arrays[role]])
+            fd, tmp = tempfile.mkstemp(dir=os.path.join(self.directory, key), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.save(f, stacked)
+                os.replace(tmp, self.path(key, role, variant))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        return key
+
+    def load(self, simulation, copy=True):
+        """
+        Warm-start simulation from the stored policy for its map. Returns
+        False (leaving it untouched) when any role is missing or was saved
+        for a different number or shape of Q-arrays.
+        """
+        key = map_hash(simulation.map.to_list())
+        variant = policy_variant(simulation)
+        current = simulation.get_q_arrays()
+        loaded = {}
+        for role in ROLES:
+            path = self.path(key, role, variant)
+            if not os.path.exists(path):
+                return False
+            stored = np.load(path, mmap_mode="r")
+            expected = (len(current[role]),) + np.shape(current[role][0]) if current[role] else (0,)
+            if stored.shape != expected:
+                return False
+            loaded[role] = list(stored)
+        simulation.set_q_arrays(loaded, copy=copy)
+        return True
+
@@ -0,0 +1,104 @@
+import gc
+import sys
+import time
+import tracemalloc
+
+# -------------------------
+# Opt-in Simulation Profiler
+# -------------------------
+class Profiler:
+    """
+    Per-phase wall time, call counters and allocation counts for one
+    simulation. Code being profiled calls mark() and then lap(phase) after
+    each phase, so a lap covers the time since the previous mark or lap.
+    Episodes are bracketed by begin_episode()/end_episode(), which record
+    the change in allocated memory blocks and garbage collections; with
+    memory=True they are also traced with tracemalloc for peak bytes, at a
+    considerable slowdown. Simulations only touch a profiler behind an
+    "is not None" check, so leaving it out costs next to nothing.
+    """
+    def __init__(self, memory=False, clock=time.perf_counter):
+        self.memory = memory
+        self.clock = clock
+        self.phases = {}
+        self.counters = {
+            "can_see": 0,
+            "line_of_sight": 0,
+            "visibility_index": 0,
+            "bresenham_line": 0,
+            "bresenham_cells": 0,
+        }
+        self.episodes = 0
+        self.ticks = 0
+        self.seconds = 0.0
+        self.allocated_blocks = 0
+        self.gc_collections = [0, 0, 0]
+        self.peak_bytes = 0
+        self._last = None
+        self._episode = None
+
+    @classmethod
+    def from_config(cls, config):
+        # Payload "profile": true, or {"memory": true} to trace allocations too.
+        if not config:
+            return None
+        if config is True:
+            config = {}
+        return cls(memory=bool(config.get("memory", False)))
+
+    def mark(self):
+        self._last = self.clock()
+
+    def lap(self, phase):
+        now = self.clock()
+        entry = self.phases.get(phase)
+        if entry is None:
+            entry = self.phases[phase] = [0.0, 0]
+        entry[0] += now - self._last
+        entry[1] += 1
+        self._last = now
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def begin_episode(self):
+        tracing = self.memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.memory:
+            tracemalloc.reset_peak()
+        self._episode = (self.clock(), sys.getallocatedblocks(),
+                         [stats["collections"] for stats in gc.get_stats()], tracing)
+        self.mark()
+
+    def end_episode(self, ticks, episodes=1):
+        started, blocks, collections, tracing = self._episode
+        self.seconds += self.clock() - started
+        self.allocated_blocks += sys.getallocatedblocks() - blocks
+        for generation, stats in enumerate(gc.get_stats()):
+            self.gc_collections[generation] += stats["collections"] - collections[generation]
+        if self.memory:
+            self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1])
+            if tracing:
+                tracemalloc.stop()
+        self.episodes += episodes
+        self.ticks += ticks
+        self._episode = None
+
+    def report(self):
+        episodes = max(self.episodes, 1)
+        report = {
+            "episodes": self.episodes,
+            "ticks": self.ticks,
+            "seconds": self.seconds,
+            "phases": {phase: {"seconds": seconds, "calls": calls}
+                       for phase, (seconds, calls) in sorted(self.phases.items(), key=lambda item: -item[1][0])},
+            "counters": dict(self.counters),
+            "allocations": {
+                "blocks_per_episode": self.allocated_blocks / episodes,
+                "gc_collections": list(self.gc_collections),
+            },
+        }
+        if self.memory:
+            report["allocations"]["peak_bytes"] = self.peak_bytes
+        return report
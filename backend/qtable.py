@@ -0,0 +1,166 @@
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+# Tables at or below this size are allocated densely up front; larger ones
+# allocate a row the first time a state is written.
+DENSE_MAX_BYTES = 8 * 1024 * 1024
+# Rows the scalar methods keep copied out as Python lists, least recently used first out.
+ROW_CACHE_MAX = 4096
+
+# -------------------------
+# State Encoding
+# -------------------------
+class StateEncoder:
+    """
+    Maps an agent's cell (and optionally its orientation, quantized into
+    orientation_buckets sectors) to a single integer state index.
+    """
+    def __init__(self, width, height, orientation_buckets=1):
+        self.width = width
+        self.height = height
+        self.buckets = max(1, orientation_buckets)
+        self.num_states = width * height * self.buckets
+
+    def encode(self, x, y, orientation=0.0):
+        cell = y * self.width + x
+        if self.buckets == 1:
+            return cell
+        bucket = int(round((orientation % (2 * math.pi)) * self.buckets / (2 * math.pi))) % self.buckets
+        return cell * self.buckets + bucket
+
+    def encode_batch(self, pos, orientation):
+        cells = pos[..., 1] * self.width + pos[..., 0]
+        if self.buckets == 1:
+            return cells
+        buckets = np.rint(np.mod(orientation, 2 * math.pi) * self.buckets / (2 * math.pi)).astype(np.int64) % self.buckets
+        return cells * self.buckets + buckets
+
+# -------------------------
+# Array-Backed Q-Table
+# -------------------------
+class QTable:
+    """
+    Q-values for num_states x num_actions in one float64 block. Small tables
+    are dense; large ones map states to rows through an index array and
+    allocate rows on first update, growing the block geometrically up to
+    max_rows. Unallocated states read as all-zero rows, and once max_rows
+    is reached updates to new states are dropped. The scalar methods work
+    on rows copied out as Python lists (written through to the array), so
+    a single step costs no NumPy calls while its states are among the last
+    row_cache_max used; anything that changes values in bulk must go through load() or
+    update_batch(), which drop those copies.
+    """
+    def __init__(self, num_states, num_actions=4, max_rows=None, dense_max_bytes=DENSE_MAX_BYTES,
+                 row_cache_max=ROW_CACHE_MAX):
+        self.num_states = num_states
+        self.num_actions = num_actions
+        self.max_rows = max_rows
+        self.dense = num_states * num_actions * 8 <= dense_max_bytes and (max_rows is None or max_rows >= num_states)
+        if self.dense:
+            self.index = np.arange(num_states, dtype=np.int64)
+            self.values = np.zeros((num_states, num_actions))
+            self.rows = num_states
+        else:
+            index_dtype = np.int32 if num_states < 2 ** 31 else np.int64
+            self.index = np.full(num_states, -1, dtype=index_dtype)
+            self.values = np.zeros((min(1024, num_states, max_rows or num_states), num_actions))
+            self.rows = 0
+        self.row_cache_max = row_cache_max
+        self._cached = OrderedDict()  # state -> (row id, row values as a list)
+
+    def load(self, values, copy=True):
+        # Replace every value; with copy=False the table uses values directly.
+        if copy:
+            self.values[:] = values
+        else:
+            self.values = values
+        self._cached.clear()
+
+    def nbytes(self):
+        return self.index.nbytes + self.values.nbytes
+
+    def _grow(self, needed):
+        capacity = len(self.values)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        if self.max_rows is not None:
+            capacity = min(capacity, self.max_rows)
+        values = np.zeros((capacity, self.num_actions))
+        values[:self.rows] = self.values[:self.rows]
+        self.values = values
+
+    def allocate(self, states):
+        """Return row ids for states, allocating rows for new ones (-1 when full)."""
+        states = np.asarray(states, dtype=np.int64)
+        rows = self.index[states]
+        if self.dense or (rows >= 0).all():
+            return rows
+        new_states = np.unique(states[rows < 0])
+        if self.max_rows is not None:
+            new_states = new_states[:max(0, self.max_rows - self.rows)]
+        if len(new_states):
+            self._grow(self.rows + len(new_states))
+            self.index[new_states] = np.arange(self.rows, self.rows + len(new_states))
+            self.rows += len(new_states)
+        return self.index[states]
+
+    # Scalar access, used by the object engine one agent at a time.
+    def _row(self, state):
+        cached = self._cached.get(state)
+        if cached is None:
+            row = int(self.index[state])
+            if row < 0:
+                return None
+            cached = self._cached[state] = (row, self.values[row].tolist())
+            if len(self._cached) > self.row_cache_max:
+                self._cached.popitem(last=False)
+        else:
+            self._cached.move_to_end(state)
+        return cached
+
+    def best_action(self, state, rng):
+        cached = self._row(state)
+        if cached is None:
+            return rng.randrange(self.num_actions)
+        q = cached[1]
+        best = max(q)
+        ties = [action for action, value in enumerate(q) if value == best]
+        return ties[0] if len(ties) == 1 else rng.choice(ties)
+
+    def max_value(self, state):
+        cached = self._row(state)
+        return max(cached[1]) if cached is not None else 0.0
+
+    def update(self, state, action, reward, next_state, alpha=0.1, gamma=0.9):
+        target = reward + gamma * self.max_value(next_state)
+        cached = self._row(state)
+        if cached is None:
+            if self.allocate([state])[0] < 0:
+                return 0.0
+            cached = self._row(state)
+        row, q = cached
+        delta = alpha * (target - q[action])
+        q[action] += delta
+        self.values[row, action] = q[action]
+        return delta
+
+    # Batched access, used by the array engine.
+    def lookup(self, states):
+        rows = self.index[states]
+        q = np.zeros((len(rows), self.num_actions))
+        known = rows >= 0
+        q[known] = self.values[rows[known]]
+        return q
+
+    def update_batch(self, states, actions, rewards, next_states, alpha=0.1, gamma=0.9):
+        self._cached.clear()
+        targets = rewards + gamma * self.lookup(next_states).max(axis=1)
+        current = self.lookup(states)[np.arange(len(states)), actions]
+        rows = self.allocate(states)
+        known = rows >= 0
+        deltas = alpha * (targets - current)
+        np.add.at(self.values, (rows[known], actions[known]), deltas[known])
+        return deltas
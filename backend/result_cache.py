@@ -0,0 +1,159 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from simulation import NUM_EPISODES, DEFAULT_ATTACKER_PARAMS, DEFAULT_DEFENDER_PARAMS, RecordingPolicy
+
+# -------------------------
+# Canonical Cache Keys
+# -------------------------
+def _canonical_position(pos):
+    pos = list(pos)
+    return [int(pos[0]), int(pos[1])] + [float(value) for value in pos[2:3]]
+
+def _canonical_params(params, defaults):
+    merged = dict(defaults)
+    merged.update(params or {})
+    return {key: float(value) for key, value in merged.items()}
+
+# Response modes cached separately: a streamed result carries every state
+# of the final episode but none of run()'s extras, so neither stands in for the other.
+CACHE_MODES = ("full", "stream")
+
+def canonical_config(config, mode="full"):
+    """
+    Everything that determines a seeded run, with defaults filled in and
+    numbers normalized so equivalent payloads produce the same key.
+    """
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode: {mode}")
+    return {
+        "mode": mode,
+        "grid": [[int(cell) for cell in row] for row in config.get("grid", [[0 for _ in range(10)] for _ in range(10)])],
+        "attacker_positions": [_canonical_position(pos) for pos in config.get("attacker_positions", [(0, 0), (0, 9)])],
+        "defender_positions": [_canonical_position(pos) for pos in config.get("defender_positions", [(3, 7), (2, 7), (8, 6)])],
+        "attacker_params": _canonical_params(config.get("attacker_params"), DEFAULT_ATTACKER_PARAMS),
+        "defender_params": _canonical_params(config.get("defender_params"), DEFAULT_DEFENDER_PARAMS),
+        "max_ticks": int(config.get("max_ticks", 1000)),
+        "episodes": int(config.get("episodes", NUM_EPISODES)),
+        "engine": config.get("engine", "object"),
+        "seed": config.get("seed"),
+        "recording": vars(RecordingPolicy.from_config(config.get("recording"))),
+        "episode_summaries": bool(config.get("episode_summaries", False)),
+        "q_state": config.get("q_state"),
+        "orientation_buckets": int(config.get("orientation_buckets", 4)),
+        "shared_q": bool(config.get("shared_q", True)),
+        "num_envs": int(config.get("num_envs", 1)),
+        "convergence": config.get("convergence"),
+        "coverage": config.get("coverage", "ray"),
+        "series": bool(config.get("series", False)),
+    }
+
+def cache_key(config, mode="full"):
+    canonical = json.dumps(canonical_config(config, mode), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+# -------------------------
+# Two-Tier Result Cache
+# -------------------------
+class ResultCache:
+    """
+    Content-addressed cache of JSON-serializable results. The memory tier
+    is an LRU bounded by entry count and encoded size; the optional disk
+    tier stores gzip files under disk_dir, evicting the least recently
+    written once disk_max_bytes is exceeded. Disk hits are promoted.
+    """
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024, disk_dir=None, disk_max_bytes=512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.disk = OrderedDict()
+        self.disk_bytes = 0
+        self.counters = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "disk_evictions": 0}
+        self.lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            files = [entry for entry in os.scandir(disk_dir) if entry.name.endswith(".json.gz")]
+            for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+                self.disk[entry.name[:-len(".json.gz")]] = entry.stat().st_size
+                self.disk_bytes += entry.stat().st_size
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key + ".json.gz")
+
+    def _remember(self, key, payload):
+        if key in self.memory:
+            self.memory_bytes -= len(self.memory.pop(key))
+        if len(payload) > self.max_bytes:
+            return
+        self.memory[key] = payload
+        self.memory_bytes += len(payload)
+        while len(self.memory) > self.max_entries or self.memory_bytes > self.max_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+            self.counters["evictions"] += 1
+
+    def _write_disk(self, key, payload):
+        data = gzip.compress(payload, compresslevel=5)
+        tmp = self._path(key) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(key))
+        self.disk_bytes += len(data) - self.disk.pop(key, 0)
+        self.disk[key] = len(data)
+        while self.disk_bytes > self.disk_max_bytes and len(self.disk) > 1:
+            evicted, size = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            self.counters["disk_evictions"] += 1
+            try:
+                os.remove(self._path(evicted))
+            except FileNotFoundError:
+                pass
+
+    def get(self, key):
+        with self.lock:
+            payload = self.memory.get(key)
+            if payload is not None:
+                self.memory.move_to_end(key)
+                self.counters["hits"] += 1
+                self.counters["memory_hits"] += 1
+                return json.loads(payload)
+            if self.disk_dir and key in self.disk:
+                try:
+                    with open(self._path(key), "rb") as f:
+                        payload = gzip.decompress(f.read())
+                except FileNotFoundError:
+                    self.disk_bytes -= self.disk.pop(key)
+                else:
+                    self._remember(key, payload)
+                    self.counters["hits"] += 1
+                    self.counters["disk_hits"] += 1
+                    return json.loads(payload)
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, key, value):
+        payload = json.dumps(value, separators=(",", ":")).encode()
+        with self.lock:
+            self._remember(key, payload)
+            if self.disk_dir:
+                self._write_disk(key, payload)
+            self.counters["stores"] += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return dict(
+                self.counters,
+                hit_rate=self.counters["hits"] / lookups if lookups else None,
+                entries=len(self.memory),
+                bytes=self.memory_bytes,
+                disk_entries=len(self.disk),
+                disk_bytes=self.disk_bytes,
+            )
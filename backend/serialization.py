@@ -0,0 +1,112 @@
+import gzip
+import json
+import time
+
+from trajectory import Trajectory, decode_grid
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip is offered without it
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed.
+COMPRESS_MIN_BYTES = 1024
+
+# States encoded per call when expanding a compact trajectory.
+STATE_CHUNK = 512
+
+ENCODERS = ("auto", "orjson", "json")
+
+def _json_dumps(value):
+    return json.dumps(value, separators=(",", ":")).encode()
+
+def _orjson_dumps(value):
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+# -------------------------
+# Result Serializer
+# -------------------------
+class Serialized:
+    """An encoded body with its content encoding and how long it took to produce."""
+    def __init__(self, body, encoding, raw_bytes, encode_seconds, compress_seconds):
+        self.body = body
+        self.encoding = encoding  # None when sent uncompressed
+        self.raw_bytes = raw_bytes
+        self.encode_seconds = encode_seconds
+        self.compress_seconds = compress_seconds
+
+    def headers(self):
+        headers = {
+            "Server-Timing": f"serialize;dur={self.encode_seconds * 1000:.2f}, "
+                             f"compress;dur={self.compress_seconds * 1000:.2f}",
+            "X-Uncompressed-Length": str(self.raw_bytes),
+            "Vary": "Accept-Encoding",
+        }
+        if self.encoding is not None:
+            headers["Content-Encoding"] = self.encoding
+        return headers
+
+class Serializer:
+    """
+    Encodes /simulate results to JSON bytes. encoder "auto" uses orjson
+    when it is installed and the standard library otherwise. A compact
+    result (see trajectory.compact_result) can be sent in the legacy
+    layout with expand=True: its states are rebuilt and encoded
+    STATE_CHUNK at a time straight from the trajectory columns, so the full
+    list of state dicts never exists. Bodies of at least min_bytes are
+    compressed with the best of brotli and gzip the client accepts.
+    """
+    def __init__(self, encoder="auto", min_bytes=COMPRESS_MIN_BYTES, gzip_level=6, brotli_quality=4):
+        if encoder not in ENCODERS:
+            raise ValueError(f"Unknown JSON encoder: {encoder}")
+        if encoder == "orjson" and orjson is None:
+            raise ValueError("The orjson encoder is not installed.")
+        self.encoder = "orjson" if encoder != "json" and orjson is not None else "json"
+        self.dumps = _orjson_dumps if self.encoder == "orjson" else _json_dumps
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    @property
+    def encodings(self):
+        return ("br", "gzip") if brotli is not None else ("gzip",)
+
+    def encode(self, result, expand=False):
+        if not expand or "trajectory" not in result:
+            return self.dumps(result)
+        head = {key: value for key, value in result.items() if key not in ("format", "map", "trajectory")}
+        head["map"] = decode_grid(result["map"])
+        parts = [self.dumps(head)[:-1], b',"states":[' if head else b'{"states":[']
+        trajectory = Trajectory.decode(result["trajectory"])
+        for i, states in enumerate(trajectory.iter_states(STATE_CHUNK)):
+            if i:
+                parts.append(b",")
+            parts.append(self.dumps(states)[1:-1])
+        parts.append(b"]}")
+        return b"".join(parts)
+
+    def compress(self, body, encoding):
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    def serialize(self, result, accept_encoding=None, expand=False):
+        """
+        Encode result, compressed with encoding negotiated from
+        accept_encoding (a werkzeug accept_encodings, or None for none).
+        """
+        start = time.perf_counter()
+        body = self.encode(result, expand)
+        encoded = time.perf_counter()
+        raw_bytes = len(body)
+        encoding = None
+        if accept_encoding is not None and raw_bytes >= self.min_bytes:
+            encoding = accept_encoding.best_match(self.encodings)
+        if encoding is not None:
+            body = self.compress(body, encoding)
+        return Serialized(body, encoding, raw_bytes, encoded - start, time.perf_counter() - encoded)
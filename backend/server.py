@@ -1,8 +1,20 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-from simulation import Simulation, Map, Strategy, DEFAULT_ATTACKER_PARAMS, DEFAULT_DEFENDER_PARAMS
+from simulation import (NUM_EPISODES, DEFAULT_ATTACKER_PARAMS, DEFAULT_DEFENDER_PARAMS, VISIBILITY_INDEX_MAX_BYTES,
+                        Map, create_simulation)
+from batch import run_batch
+from distributed import run_distributed
+from jobs import JobQueue, QueueFull
+from trajectory import Trajectory, compact_result, expand_result
+from result_cache import ResultCache, cache_key
+from policy_store import PolicyStore, map_hash
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, SIZE_BUCKETS, Registry
+from serialization import Serializer
 from anthropic import Anthropic
 import os
+import json
+import threading
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -14,6 +26,119 @@ CORS(app)
 # Initialize Anthropic client
 anthropic = Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
 
+# Results of seeded runs, keyed by their canonical config
+result_cache = ResultCache(
+    max_entries=int(os.getenv('RESULT_CACHE_ENTRIES', 128)),
+    max_bytes=int(os.getenv('RESULT_CACHE_BYTES', 64 * 1024 * 1024)),
+    disk_dir=os.getenv('RESULT_CACHE_DIR') or None,
+    disk_max_bytes=int(os.getenv('RESULT_CACHE_DISK_BYTES', 512 * 1024 * 1024)),
+)
+
+# Trained Q-values, keyed by map hash and role
+policy_store = PolicyStore(os.getenv('POLICY_STORE_DIR', 'policies'))
+
+# Background simulation jobs
+jobs = JobQueue(
+    workers=int(os.getenv('JOB_WORKERS', 2)),
+    max_pending=int(os.getenv('JOB_MAX_PENDING', 16)),
+    max_results=int(os.getenv('JOB_MAX_RESULTS', 256)),
+    result_ttl=float(os.getenv('JOB_RESULT_TTL', 600)),
+)
+
+# Simulations run at once per process; later requests wait up to
+# SIMULATION_WAIT_SECONDS for a slot, then get a 503
+simulation_slots = threading.BoundedSemaphore(int(os.getenv('MAX_CONCURRENT_SIMULATIONS', 4)))
+SIMULATION_WAIT_SECONDS = float(os.getenv('SIMULATION_WAIT_SECONDS', 30))
+# Processes one /simulate/batch or /simulate/distributed call may start
+MAX_BATCH_WORKERS = int(os.getenv('MAX_BATCH_WORKERS', os.cpu_count() or 1))
+
+# Maps with fully built visibility indexes, by map hash (filled by wsgi.py before workers fork)
+preloaded_maps = {}
+
+# JSON encoder ("auto", "orjson" or "json") and compression for /simulate results
+serializer = Serializer(
+    encoder=os.getenv('JSON_ENCODER', 'auto'),
+    min_bytes=int(os.getenv('COMPRESS_MIN_BYTES', 1024)),
+)
+
+# Prometheus metrics, served at /metrics
+metrics = Registry()
+request_seconds = metrics.histogram(
+    "ic_http_request_seconds", "Request latency by route, method and status (streams: until the response starts).",
+    ("endpoint", "method", "status"))
+response_bytes = metrics.histogram(
+    "ic_http_response_bytes", "Response body size by route, for responses that are not streamed.",
+    ("endpoint",), buckets=SIZE_BUCKETS)
+simulations_total = metrics.counter(
+    "ic_simulations_total", "Simulations requested, by whether the result cache answered them.", ("cached",))
+simulation_seconds = metrics.histogram(
+    "ic_simulation_seconds", "Time spent running simulations, excluding statistics.")
+statistics_seconds = metrics.histogram(
+    "ic_statistics_seconds", "Time spent computing episode statistics.")
+serialization_seconds = metrics.histogram(
+    "ic_serialization_seconds", "Time spent encoding simulation results as JSON, by response format.", ("format",))
+compression_seconds = metrics.histogram(
+    "ic_compression_seconds", "Time spent compressing simulation results, by content encoding.", ("encoding",))
+serialized_bytes = metrics.histogram(
+    "ic_serialized_bytes", "Encoded simulation result size before compression, by response format.",
+    ("format",), buckets=SIZE_BUCKETS)
+simulations_rejected = metrics.counter(
+    "ic_simulations_rejected_total", "Simulation requests turned away because every slot stayed busy.")
+upstream_seconds = metrics.histogram(
+    "ic_upstream_request_seconds", "Latency of calls to upstream APIs, by upstream and outcome.", ("upstream", "outcome"))
+metrics.gauge("ic_job_queue_depth", "Background jobs queued or running.", fn=jobs.depth)
+metrics.gauge("ic_result_cache_entries", "Results held in the in-memory result cache.",
+              fn=lambda: result_cache.stats()["entries"])
+metrics.counter("ic_result_cache_hits_total", "Result cache hits.", fn=lambda: result_cache.stats()["hits"])
+metrics.counter("ic_result_cache_misses_total", "Result cache misses.", fn=lambda: result_cache.stats()["misses"])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get("request_started")
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        request_seconds.observe(time.perf_counter() - started, endpoint=endpoint,
+                                method=request.method, status=response.status_code)
+        if not response.is_streamed:
+            response_bytes.observe(response.calculate_content_length() or 0, endpoint=endpoint)
+    return response
+
+def preload_map(grid, radius):
+    # No size limit for the operator's own preload; requests that reach the
+    # map later are held to the usual limit again.
+    game_map = Map(grid, visibility_max_bytes=None)
+    game_map.enable_visibility_index(radius)
+    game_map.visibility_max_bytes = VISIBILITY_INDEX_MAX_BYTES
+    preloaded_maps[map_hash(grid)] = game_map
+    return game_map
+
+def request_vision_range(data):
+    ranges = [dict(defaults, **(data.get(key) or {}))["vision_range"]
+              for key, defaults in (("attacker_params", DEFAULT_ATTACKER_PARAMS),
+                                    ("defender_params", DEFAULT_DEFENDER_PARAMS))]
+    return max(float(vision_range) for vision_range in ranges)
+
+def request_map(data):
+    # The object engine can reuse a preloaded map; anything else builds its own.
+    grid = data.get("grid")
+    if not preloaded_maps or data.get("engine", "object") != "object" or not isinstance(grid, list):
+        return None
+    game_map = preloaded_maps.get(map_hash(grid))
+    # A wider vision range would replace the index the workers share, so build a private map instead.
+    if game_map is None or game_map.visibility.radius < request_vision_range(data):
+        return None
+    return game_map
+
+def record_simulation(simulation, seconds):
+    # seconds covers the whole run; statistics are reported separately.
+    simulations_total.inc(cached="false")
+    simulation_seconds.observe(max(seconds - simulation.stats_seconds, 0.0))
+    statistics_seconds.observe(simulation.stats_seconds)
+
 @app.route("/simulate", methods=["POST", "OPTIONS"])
 def simulate_endpoint():
     if request.method == "OPTIONS":
@@ -22,21 +147,249 @@ def simulate_endpoint():
 
     # For POST requests, force reading JSON.
     data = request.get_json(force=True)
-    
-    grid = data.get("grid", [[0 for _ in range(10)] for _ in range(10)])
-    attacker_positions = data.get("attacker_positions", [(0, 0), (0, 9)])
-    defender_positions = data.get("defender_positions", [(3, 7), (2, 7), (8, 6)])
-    attacker_params = data.get("attacker_params", DEFAULT_ATTACKER_PARAMS)
-    defender_params = data.get("defender_params", DEFAULT_DEFENDER_PARAMS)
-    
-    # Convert list positions to tuples.
-    attacker_positions = [tuple(pos) for pos in attacker_positions]
-    defender_positions = [tuple(pos) for pos in defender_positions]
-    
-    strategy = Strategy(attacker_positions)
-    simulation = Simulation(Map(grid), strategy, defender_positions, attacker_params, defender_params)
-    result = simulation.run()
-    return jsonify(result)
+
+    # Grid, positions, params and "engine" are read by create_simulation.
+    try:
+        simulation = create_simulation(data, game_map=request_map(data))
+        stream_format = streaming_format(data)
+        key = request_cache_key(data, "stream" if stream_format is not None else "full")
+        after = load_policy(simulation, data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+
+    if not simulation_slots.acquire(timeout=SIMULATION_WAIT_SECONDS):
+        simulations_rejected.inc()
+        return jsonify({"error": "Too many simulations in progress"}), 503, {"Retry-After": "5"}
+
+    # Streaming clients get the final episode tick by tick instead of one blob.
+    if stream_format is not None:
+        # The slot is held until the stream has been sent.
+        response = stream_simulation(simulation, stream_format, key, after)
+        response.call_on_close(simulation_slots.release)
+        return response
+
+    compact = wants_compact(data)
+    try:
+        result = run_simulation(simulation, key, compact, after=after, expand=False)
+    finally:
+        simulation_slots.release()
+    return result_response(result, compact)
+
+def result_response(result, compact):
+    # Cached results arrive compact; for legacy clients they are expanded while encoding.
+    serialized = serializer.serialize(result, request.accept_encodings, expand=not compact)
+    response_format = "compact" if compact else "json"
+    serialization_seconds.observe(serialized.encode_seconds, format=response_format)
+    serialized_bytes.observe(serialized.raw_bytes, format=response_format)
+    if serialized.encoding is not None:
+        compression_seconds.observe(serialized.compress_seconds, encoding=serialized.encoding)
+    return Response(serialized.body, mimetype="application/json", headers=serialized.headers())
+
+def request_cache_key(data, mode="full"):
+    # Only seeded runs are reproducible, so only those are cached. Runs
+    # starting from a stored policy depend on the store, and time-budgeted
+    # and profiled runs on the clock, so they are not. Streamed and full
+    # results are different shapes and are keyed apart (see CACHE_MODES).
+    if (data.get("seed") is None or data.get("policy", "train") != "train" or data.get("time_budget") is not None
+            or data.get("profile")):
+        return None
+    return cache_key(data, mode)
+
+POLICY_MODES = ("train", "warm_start", "inference")
+
+def load_policy(simulation, data):
+    """
+    Apply the payload's "policy" mode: "train" (from scratch), "warm_start"
+    (continue from the stored policy, if any) or "inference" (stored policy,
+    one greedy episode, no Q-updates). Returns the callable that saves the
+    trained policy afterwards, or None.
+    """
+    mode = data.get("policy", "train")
+    if mode not in POLICY_MODES:
+        raise ValueError(f"Unknown policy mode: {mode}")
+    if mode == "inference":
+        if not policy_store.load(simulation, copy=False):
+            raise LookupError("No stored policy for this map")
+        simulation.set_learning(False)
+        simulation.num_episodes = 1
+        return None
+    if mode == "warm_start":
+        policy_store.load(simulation)
+    if mode == "warm_start" or data.get("save_policy"):
+        return lambda: policy_store.save(simulation)
+    return None
+
+def run_simulation(simulation, key, compact, callback=None, after=None, expand=True):
+    # With expand=False a cache hit is returned compact even when compact is false.
+    cached = result_cache.get(key) if key is not None else None
+    if cached is not None:
+        simulations_total.inc(cached="true")
+        return cached if compact or not expand else expand_result(cached)
+    start = time.perf_counter()
+    result = simulation.run(callback=callback)
+    record_simulation(simulation, time.perf_counter() - start)
+    if after is not None:
+        after()
+    if key is None:
+        return compact_result(result) if compact else result
+    # The cache always holds the compact form.
+    cached = compact_result(result)
+    result_cache.put(key, cached)
+    return cached if compact else result
+
+COMPACT_MIMETYPE = "application/vnd.ic.compact+json"
+
+def wants_compact(data):
+    # Compact trajectories are opt-in via the payload or the Accept header.
+    return data.get("format") == "compact" or request.accept_mimetypes.best == COMPACT_MIMETYPE
+
+STREAM_MIMETYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+def streaming_format(data):
+    accept = request.accept_mimetypes
+    if accept.best in ("application/x-ndjson", "text/event-stream"):
+        return "ndjson" if accept.best == "application/x-ndjson" else "sse"
+    stream_format = data.get("stream")
+    if stream_format in (None, False):
+        return None
+    if stream_format not in STREAM_MIMETYPES:
+        stream_format = "ndjson"
+    return stream_format
+
+def stream_events(simulation, key, after=None):
+    cached = result_cache.get(key) if key is not None else None
+    if cached is not None:
+        simulations_total.inc(cached="true")
+        result = expand_result(cached)
+        yield {"type": "map", "map": result["map"]}
+        for state in result["states"]:
+            yield {"type": "state", "state": state}
+        yield {"type": "result", **{k: v for k, v in result.items() if k not in ("map", "states")}}
+        return
+    trajectory = Trajectory()
+    events = simulation.stream()
+    elapsed = 0.0
+    while True:
+        # Only time spent inside the simulation counts, not the client's reads.
+        start = time.perf_counter()
+        event = next(events, None)
+        elapsed += time.perf_counter() - start
+        if event is None:
+            record_simulation(simulation, elapsed)
+            return
+        if event["type"] == "state" and key is not None:
+            trajectory.append(event["state"])
+        elif event["type"] == "result" and key is not None:
+            result = {"map": simulation.map.to_list(), **{k: v for k, v in event.items() if k != "type"}}
+            result_cache.put(key, compact_result(result, trajectory))
+        if event["type"] == "result" and after is not None:
+            after()
+        yield event
+
+def stream_simulation(simulation, stream_format, key=None, after=None):
+    def generate():
+        encoding = 0.0
+        for event in stream_events(simulation, key, after):
+            start = time.perf_counter()
+            payload = json.dumps(event, separators=(",", ":"))
+            encoding += time.perf_counter() - start
+            if stream_format == "sse":
+                yield f"event: {event['type']}\ndata: {payload}\n\n"
+            else:
+                yield payload + "\n"
+        serialization_seconds.observe(encoding, format=stream_format)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype=STREAM_MIMETYPES[stream_format], headers=headers)
+
+def request_workers(data):
+    workers = data.get("workers")
+    if workers is None:
+        return MAX_BATCH_WORKERS
+    workers = int(workers)
+    if workers < 1:
+        raise ValueError("workers must be at least 1.")
+    return min(workers, MAX_BATCH_WORKERS)
+
+def run_pooled(run, *args, **kwargs):
+    # A whole process pool holds one simulation slot for the length of the call.
+    if not simulation_slots.acquire(timeout=SIMULATION_WAIT_SECONDS):
+        simulations_rejected.inc()
+        return jsonify({"error": "Too many simulations in progress"}), 503, {"Retry-After": "5"}
+    try:
+        return jsonify(run(*args, **kwargs))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        simulation_slots.release()
+
+@app.route("/simulate/batch", methods=["POST"])
+def simulate_batch_endpoint():
+    # Same payload as /simulate plus "runs", "workers" and "seed".
+    data = request.get_json(force=True)
+    try:
+        n_runs = int(data.get("runs", 32))
+        workers = request_workers(data)
+        base_seed = int(data.get("seed", 0))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return run_pooled(run_batch, data, n_runs, workers=workers, base_seed=base_seed)
+
+@app.route("/simulate/distributed", methods=["POST"])
+def simulate_distributed_endpoint():
+    # Same payload as /simulate plus "episodes", "workers", "sync_every", "seed" and "baseline".
+    data = request.get_json(force=True)
+    try:
+        num_episodes = int(data.get("episodes", NUM_EPISODES))
+        workers = request_workers(data)
+        sync_every = int(data.get("sync_every", 10))
+        base_seed = int(data.get("seed", 0))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return run_pooled(run_distributed, data, num_episodes, workers=workers, sync_every=sync_every,
+                      base_seed=base_seed, baseline=bool(data.get("baseline", False)))
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    # Same payload as /simulate; returns a job id to poll instead of the result.
+    data = request.get_json(force=True)
+    try:
+        simulation = create_simulation(data, game_map=request_map(data))
+        key = request_cache_key(data)
+        after = load_policy(simulation, data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    compact = wants_compact(data)
+    try:
+        job = jobs.submit(lambda job: run_simulation(simulation, key, compact, callback=job.checkpoint, after=after))
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    return jsonify(job.to_dict()), 202
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(job.to_dict(include_result=False))
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
 
 @app.route("/ask-claude", methods=["POST"])
 def ask_claude():
@@ -46,6 +399,7 @@ def ask_claude():
     if not prompt:
         return jsonify({"error": "No prompt provided"}), 400
     
+    start = time.perf_counter()
     try:
         # Create a message to Claude
         message = anthropic.messages.create(
@@ -60,6 +414,8 @@ def ask_claude():
             }]
         )
         
+        upstream_seconds.observe(time.perf_counter() - start, upstream="anthropic", outcome="ok")
+
         # Extract the response content
         response = message.content[0].text
         
@@ -68,9 +424,11 @@ def ask_claude():
         })
     
     except Exception as e:
+        upstream_seconds.observe(time.perf_counter() - start, upstream="anthropic", outcome="error")
         return jsonify({
             "error": str(e)
         }), 500
 
 if __name__ == '__main__':
+    # Development server; see README.md for serving with worker processes.
     app.run(debug=True, port=5000)
\ No newline at end of file
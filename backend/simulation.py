@@ -2,10 +2,20 @@ import random
 import math
 import json
 import statistics
+import time
+
+from profiler import Profiler
+from viewcone import CONE_MAX_RADIUS, step_orientation, view_cone
 
 # Global variable for the number of training episodes.
 NUM_EPISODES = 10
 
+# Largest visibility index a Map builds; bigger maps walk lines instead.
+VISIBILITY_INDEX_MAX_BYTES = 64 * 1024 * 1024
+
+# Coverage metrics reported by Statistics.
+COVERAGE_MODES = ("ray", "cone")
+
 # -------------------------
 # Helper: Bresenham Line Algorithm
 # -------------------------
@@ -37,25 +47,185 @@ def bresenham_line(x0, y0, x1, y1):
     points.append((x1, y1))
     return points
 
+# -------------------------
+# Visibility Index
+# -------------------------
+_OFFSET_PATHS = {}
+
+def offset_paths(radius):
+    """
+    Relative Bresenham paths for every offset within radius of (0, 0).
+    The line only depends on the offset, so one table serves every cell.
+    Each entry is (dx, dy, cells) with the source cell left out.
+    """
+    paths = _OFFSET_PATHS.get(radius)
+    if paths is None:
+        paths = []
+        for dy in range(-radius, radius + 1):
+            for dx in range(-radius, radius + 1):
+                if dx * dx + dy * dy <= radius * radius:
+                    paths.append((dx, dy, tuple(bresenham_line(0, 0, dx, dy)[1:])))
+        _OFFSET_PATHS[radius] = paths
+    return paths
+
+class VisibilityIndex:
+    """
+    Per-map line-of-sight table, built up front. Every cell gets a row of
+    one bit per offset within radius saying whether the line to that cell
+    is clear; all rows are filled at once from shifted copies of a
+    wall-padded free mask and kept in one flat bytes object. Read-only once
+    built, so one index can be shared between threads.
+    """
+    def __init__(self, game_map, radius):
+        import numpy as np
+        self.map = game_map
+        self.radius = radius
+        self.span = 2 * radius + 1
+        self.width = game_map.width
+        self.stride = (self.span * self.span + 7) // 8
+        height, width = game_map.height, game_map.width
+        free = np.asarray(game_map.grid, dtype=np.int64).reshape(height, width) == 0
+        padded = np.zeros((height + 2 * radius, width + 2 * radius), dtype=bool)
+        padded[radius:radius + height, radius:radius + width] = free
+
+        def shifted(px, py):
+            return padded[radius + py:radius + py + height, radius + px:radius + px + width]
+
+        table = np.zeros((height, width, self.stride), dtype=np.uint8)
+        # Paths in order of length: most extend a path one cell shorter, whose
+        # clear mask is reused, so each offset usually costs one AND.
+        shorter, lines, length = {}, {}, 0
+        for dx, dy, path in sorted(offset_paths(radius), key=lambda entry: len(entry[2])):
+            if len(path) > length:
+                shorter, lines, length = lines, {}, len(path)
+            line = shorter.get(path[:-1])
+            if line is None:
+                line = np.ones((height, width), dtype=bool)
+                for px, py in path[:-1]:
+                    line &= shifted(px, py)
+            if path:
+                line = line & shifted(*path[-1])
+            lines[path] = line
+            bit = self.bit(dx, dy)
+            table[:, :, bit >> 3] |= line.view(np.uint8) << (bit & 7)
+        self.table = table.tobytes()
+
+    @staticmethod
+    def size(game_map, radius):
+        """Bytes an index of this radius takes for game_map."""
+        span = 2 * radius + 1
+        return game_map.width * game_map.height * ((span * span + 7) // 8)
+
+    def bit(self, dx, dy):
+        return (dy + self.radius) * self.span + dx + self.radius
+
+    def is_visible(self, x0, y0, x1, y1):
+        dx = x1 - x0
+        dy = y1 - y0
+        r = self.radius
+        if dx * dx + dy * dy > r * r:
+            # Outside the table: walk the line directly.
+            for (cx, cy) in bresenham_line(x0, y0, x1, y1)[1:]:
+                if not self.map.is_free(cx, cy):
+                    return False
+            return True
+        bit = (dy + r) * self.span + dx + r
+        return (self.table[(y0 * self.width + x0) * self.stride + (bit >> 3)] >> (bit & 7)) & 1 == 1
+
+# -------------------------
+# Spatial Index
+# -------------------------
+class SpatialIndex:
+    """
+    Uniform grid of bucket_size x bucket_size cell blocks holding alive
+    agents. Agents report moves through Agent.move_to and are removed when
+    they die, so nearby() only visits the blocks overlapping a query square.
+    """
+    def __init__(self, bucket_size):
+        self.bucket_size = max(1, int(bucket_size))
+        self.buckets = {}
+
+    def _key(self, x, y):
+        return (x // self.bucket_size, y // self.bucket_size)
+
+    def rebuild(self, agents):
+        self.buckets = {}
+        for agent in agents:
+            if agent.alive:
+                self.insert(agent)
+
+    def insert(self, agent):
+        self.buckets.setdefault(self._key(agent.x, agent.y), set()).add(agent)
+        agent.spatial = self
+
+    def remove(self, agent):
+        key = self._key(agent.x, agent.y)
+        bucket = self.buckets.get(key)
+        if bucket is not None:
+            bucket.discard(agent)
+            if not bucket:
+                del self.buckets[key]
+        agent.spatial = None
+
+    def move(self, agent, old_x, old_y):
+        old_key = self._key(old_x, old_y)
+        new_key = self._key(agent.x, agent.y)
+        if old_key != new_key:
+            bucket = self.buckets[old_key]
+            bucket.discard(agent)
+            if not bucket:
+                del self.buckets[old_key]
+            self.buckets.setdefault(new_key, set()).add(agent)
+
+    def nearby(self, x, y, radius):
+        """Agents in blocks overlapping the square of radius around (x, y), in id order."""
+        r = int(math.ceil(radius))
+        bx0, by0 = self._key(x - r, y - r)
+        bx1, by1 = self._key(x + r, y + r)
+        found = []
+        buckets = self.buckets
+        for by in range(by0, by1 + 1):
+            for bx in range(bx0, bx1 + 1):
+                bucket = buckets.get((bx, by))
+                if bucket:
+                    found.extend(bucket)
+        found.sort(key=lambda agent: agent.id)
+        return found
+
 # -------------------------
 # Map / Building Class
 # -------------------------
 class Map:
-    def __init__(self, grid):
+    def __init__(self, grid, visibility_max_bytes=VISIBILITY_INDEX_MAX_BYTES):
         self.grid = grid  # grid: 0 = free; 1 = wall.
         self.height = len(grid)
         self.width = len(grid[0]) if self.height > 0 else 0
+        self.visibility_max_bytes = visibility_max_bytes
+        self.visibility = None
+
+    def enable_visibility_index(self, radius):
+        # Reuse an existing index when it already covers the requested radius.
+        # Returns None (lines are walked) when the index would exceed the byte limit.
+        radius = int(math.ceil(radius))
+        if self.visibility is None or self.visibility.radius < radius:
+            if self.visibility_max_bytes is not None and VisibilityIndex.size(self, radius) > self.visibility_max_bytes:
+                return self.visibility
+            self.visibility = VisibilityIndex(self, radius)
+        return self.visibility
+
+    def to_list(self):
+        return self.grid
 
     def is_free(self, x, y):
         if 0 <= x < self.width and 0 <= y < self.height:
             return self.grid[y][x] == 0
         return False
 
-    def get_random_free_cell(self):
+    def get_random_free_cell(self, rng=random):
         free_cells = [(x, y) for y in range(self.height) for x in range(self.width) if self.is_free(x, y)]
         if not free_cells:
             raise ValueError("No free cells available on the map.")
-        return random.choice(free_cells)
+        return rng.choice(free_cells)
 
 # -------------------------
 # Strategy Class for Attackers
@@ -87,8 +257,9 @@ DEFAULT_DEFENDER_PARAMS = {
 # Base Agent Class
 # -------------------------
 class Agent:
-    def __init__(self, id, x, y, vision_range=3, orientation=0, view_angle=math.pi/4, sound_radius=3):
+    def __init__(self, id, x, y, vision_range=3, orientation=0, view_angle=math.pi/4, sound_radius=3, rng=random):
         self.id = id
+        self.rng = rng  # random.Random instance, or the random module itself
         self.x = x
         self.y = y
         self.vision_range = vision_range
@@ -96,6 +267,9 @@ class Agent:
         self.view_angle = view_angle
         self.sound_radius = sound_radius
         self.alive = True
+        self.spatial = None  # SpatialIndex this agent is filed in, if any
+        self._cone = None  # ViewCone for the current orientation
+        self.counters = None  # Profiler counters, when profiling
 
     def position(self):
         return (self.x, self.y)
@@ -106,8 +280,18 @@ class Agent:
         return math.sqrt(dx * dx + dy * dy)
 
     def line_of_sight_clear(self, other, game_map):
+        counters = self.counters
+        if counters is not None:
+            counters["line_of_sight"] += 1
+        if game_map.visibility is not None:
+            if counters is not None:
+                counters["visibility_index"] += 1
+            return game_map.visibility.is_visible(self.x, self.y, other.x, other.y)
         # Get all points along the line from self to other.
         line = bresenham_line(self.x, self.y, other.x, other.y)
+        if counters is not None:
+            counters["bresenham_line"] += 1
+            counters["bresenham_cells"] += len(line) - 1
         # Skip our own cell.
         for (cx, cy) in line[1:]:
             if not game_map.is_free(cx, cy):
@@ -115,10 +299,22 @@ class Agent:
         return True
 
     def can_see(self, other, game_map, epsilon=1e-6):
+        if self.counters is not None:
+            self.counters["can_see"] += 1
         if not other.alive:
             return False
         dx = other.x - self.x
         dy = other.y - self.y
+        if self.vision_range <= CONE_MAX_RADIUS:
+            # Precomputed cone for the current orientation, then line of sight.
+            cone = self._cone
+            if (cone is None or cone.orientation != self.orientation or cone.vision_range != self.vision_range
+                    or cone.view_angle != self.view_angle or cone.epsilon != epsilon):
+                cone = self._cone = view_cone(self.orientation, self.vision_range, self.view_angle, epsilon)
+            r = cone.radius
+            if not (-r <= dx <= r and -r <= dy <= r) or not (cone.bits >> ((dy + r) * cone.span + dx + r)) & 1:
+                return False
+            return self.line_of_sight_clear(other, game_map)
         distance = math.sqrt(dx * dx + dy * dy)
         if distance > self.vision_range:
             return False
@@ -136,16 +332,24 @@ class Agent:
         return self.distance_to(other) <= self.sound_radius
 
     def move_to(self, x, y):
-        dx = x - self.x
-        dy = y - self.y
+        old_x, old_y = self.x, self.y
+        dx = x - old_x
+        dy = y - old_y
         if dx or dy:
-            self.orientation = math.atan2(dy, dx)
+            self.orientation = step_orientation(dx, dy)
         self.x = x
         self.y = y
+        if self.spatial is not None:
+            self.spatial.move(self, old_x, old_y)
+
+    def die(self):
+        self.alive = False
+        if self.spatial is not None:
+            self.spatial.remove(self)
 
     def move_randomly(self, game_map):
         directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-        random.shuffle(directions)
+        self.rng.shuffle(directions)
         for dx, dy in directions:
             new_x = self.x + dx
             new_y = self.y + dy
@@ -157,7 +361,7 @@ class Agent:
         best_move = None
         best_dist = float("inf")
         directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-        random.shuffle(directions)
+        self.rng.shuffle(directions)
         for dx, dy in directions:
             new_x = self.x + dx
             new_y = self.y + dy
@@ -174,38 +378,61 @@ class Agent:
 # -------------------------
 class RLAgent(Agent):
     ACTIONS = ["up", "down", "left", "right"]
-    def __init__(self, id, x, y, vision_range, orientation, view_angle, sound_radius):
-        super().__init__(id, x, y, vision_range, orientation, view_angle, sound_radius)
+    def __init__(self, id, x, y, vision_range, orientation, view_angle, sound_radius, rng=random):
+        super().__init__(id, x, y, vision_range, orientation, view_angle, sound_radius, rng)
         self.starting_position = (x, y)
         self.q_values = {action: 0.0 for action in self.ACTIONS}
         self.last_action = None
+        # Optional state-indexed Q-table (see qtable.py); q_values is used when unset.
+        self.q_table = None
+        self.state_encoder = None
+        self.last_state = None
+
+    def attach_q_table(self, q_table, state_encoder):
+        self.q_table = q_table
+        self.state_encoder = state_encoder
+
+    def state_index(self):
+        return self.state_encoder.encode(self.x, self.y, self.orientation)
 
     def choose_action(self, epsilon=0.1):
-        if random.random() < epsilon:
-            action = random.choice(self.ACTIONS)
+        if self.q_table is not None:
+            self.last_state = self.state_index()
+            if self.rng.random() < epsilon:
+                action = self.rng.choice(self.ACTIONS)
+            else:
+                action = self.ACTIONS[self.q_table.best_action(self.last_state, self.rng)]
+        elif self.rng.random() < epsilon:
+            action = self.rng.choice(self.ACTIONS)
         else:
             max_q = max(self.q_values.values())
             best_actions = [a for a, q in self.q_values.items() if q == max_q]
-            action = random.choice(best_actions)
+            action = self.rng.choice(best_actions)
         self.last_action = action
         return action
 
     def update_q(self, reward, alpha=0.1, gamma=0.9):
-        if self.last_action is not None:
-            current_q = self.q_values[self.last_action]
-            max_future_q = max(self.q_values.values())
-            self.q_values[self.last_action] = current_q + alpha * (reward + gamma * max_future_q - current_q)
+        # Returns how much the updated Q-value moved.
+        if self.last_action is None:
+            return 0.0
+        if self.q_table is not None:
+            return self.q_table.update(self.last_state, self.ACTIONS.index(self.last_action), reward,
+                                       self.state_index(), alpha, gamma)
+        current_q = self.q_values[self.last_action]
+        max_future_q = max(self.q_values.values())
+        self.q_values[self.last_action] = current_q + alpha * (reward + gamma * max_future_q - current_q)
+        return self.q_values[self.last_action] - current_q
 
 # -------------------------
 # RLAttacker and RLDefender Classes
 # -------------------------
 class Attacker(RLAgent):
-    def __init__(self, id, x, y, params={}):
+    def __init__(self, id, x, y, params={}, rng=random):
         vision_range = params.get("vision_range", DEFAULT_ATTACKER_PARAMS["vision_range"])
         view_angle = params.get("view_angle", DEFAULT_ATTACKER_PARAMS["view_angle"])
         sound_radius = params.get("sound_radius", DEFAULT_ATTACKER_PARAMS["sound_radius"])
-        orientation = params.get("orientation", random.uniform(0, 2 * math.pi))
-        super().__init__(id, x, y, vision_range, orientation, view_angle, sound_radius)
+        orientation = params.get("orientation", rng.uniform(0, 2 * math.pi))
+        super().__init__(id, x, y, vision_range, orientation, view_angle, sound_radius, rng)
         self.reaction = params.get("reaction", DEFAULT_ATTACKER_PARAMS["reaction"])
         self.visited = {(x, y)}
         self.score = 0
@@ -250,12 +477,12 @@ class Attacker(RLAgent):
             return -10
 
 class Defender(RLAgent):
-    def __init__(self, id, x, y, params={}):
+    def __init__(self, id, x, y, params={}, rng=random):
         vision_range = params.get("vision_range", DEFAULT_DEFENDER_PARAMS["vision_range"])
         view_angle = params.get("view_angle", DEFAULT_DEFENDER_PARAMS["view_angle"])
         sound_radius = params.get("sound_radius", DEFAULT_DEFENDER_PARAMS["sound_radius"])
-        orientation = params.get("orientation", random.uniform(0, 2 * math.pi))
-        super().__init__(id, x, y, vision_range, orientation, view_angle, sound_radius)
+        orientation = params.get("orientation", rng.uniform(0, 2 * math.pi))
+        super().__init__(id, x, y, vision_range, orientation, view_angle, sound_radius, rng)
         self.reaction = params.get("reaction", DEFAULT_DEFENDER_PARAMS["reaction"])
 
     def perform_action(self, action, game_map):
@@ -279,13 +506,155 @@ class Defender(RLAgent):
         else:
             return -1
 
+# -------------------------
+# Recording Policy for Training Runs
+# -------------------------
+class RecordingPolicy:
+    """
+    Decides which training episodes pay for state snapshots and statistics.
+    mode is "none", "last" (final episode only), "every" (every Nth episode
+    plus the final one) or "sampled" (final episode, keeping one state every
+    tick_stride ticks). tick_stride also thins recorded "every" episodes.
+    Statistics always cover every tick of a recorded episode.
+    """
+    MODES = ("none", "last", "every", "sampled")
+
+    def __init__(self, mode="last", every=1, tick_stride=1):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown recording mode: {mode}")
+        if every < 1 or tick_stride < 1:
+            raise ValueError("Recording intervals must be at least 1.")
+        self.mode = mode
+        self.every = every
+        self.tick_stride = tick_stride if mode in ("every", "sampled") else 1
+
+    @classmethod
+    def from_config(cls, config):
+        # true/null keep the default, false records nothing.
+        if config is None or config is True:
+            return cls()
+        if config is False:
+            return cls("none")
+        if isinstance(config, str):
+            return cls(config)
+        if not isinstance(config, dict):
+            raise ValueError("recording must be a mode name, a boolean or a dict of options.")
+        return cls(config.get("mode", "last"), int(config.get("every", 1)), int(config.get("tick_stride", 1)))
+
+    def records(self, episode, num_episodes):
+        if self.mode == "none":
+            return False
+        if episode == num_episodes - 1:
+            return True
+        return self.mode == "every" and (episode + 1) % self.every == 0
+
+# -------------------------
+# Convergence Monitor
+# -------------------------
+class ConvergenceMonitor:
+    """
+    Watches episode summaries and says when run_training may stop early.
+    Every episode, the attacker win rate, ticks and mean Q-value delta
+    averaged over the last window episodes are compared with the previous
+    window's. A metric counts as unchanged when the difference is within
+    z standard errors of the two window means, or within tolerance of
+    the previous mean (relative); a win rate also may move by one
+    episode's worth (1 / window). Learning counts as converged once all
+    three stay unchanged for patience consecutive episodes. time_budget
+    (seconds) caps wall-clock training time. tolerance=None only enforces
+    the budget.
+    """
+    def __init__(self, tolerance=0.05, window=100, patience=50, min_episodes=0, time_budget=None, z=2.0,
+                 clock=time.perf_counter):
+        if window < 1 or patience < 1:
+            raise ValueError("Convergence window and patience must be at least 1.")
+        self.tolerance = tolerance
+        self.window = window
+        self.patience = patience
+        self.min_episodes = min_episodes
+        self.time_budget = time_budget
+        self.z = z
+        self.clock = clock
+        self.start()
+
+    @classmethod
+    def from_config(cls, config, time_budget=None):
+        if config is None or config is False:
+            return cls(tolerance=None, time_budget=time_budget) if time_budget is not None else None
+        if config is True:
+            config = {}
+        if not isinstance(config, dict):
+            raise ValueError("convergence must be true, false or a dict of options.")
+        return cls(config.get("tolerance", 0.05), int(config.get("window", 100)), int(config.get("patience", 50)),
+                   int(config.get("min_episodes", 0)), time_budget, float(config.get("z", 2.0)))
+
+    def start(self):
+        self.started = self.clock()
+        self.history = []
+        self.stable = 0
+        self.changes = None
+        self.bounds = None
+
+    def _metrics(self, summaries):
+        return {
+            "win_rate": [1.0 if s["attackers_win"] else 0.0 for s in summaries],
+            "ticks": [float(s["ticks"]) for s in summaries],
+            "q_delta": [float(s["q_delta"]) for s in summaries],
+        }
+
+    def observe(self, summary):
+        """Record one episode; returns a stop reason, or None to keep training."""
+        self.history.append(summary)
+        if self.time_budget is not None and self.clock() - self.started >= self.time_budget:
+            return "time_budget"
+        if self.tolerance is None or len(self.history) < 2 * self.window:
+            return None
+        previous = self._metrics(self.history[-2 * self.window:-self.window])
+        current = self._metrics(self.history[-self.window:])
+        self.changes = {}
+        self.bounds = {}
+        for key, before in previous.items():
+            after = current[key]
+            before_mean = statistics.fmean(before)
+            noise = self.z * math.sqrt((statistics.pvariance(before) + statistics.pvariance(after)) / self.window)
+            self.changes[key] = abs(statistics.fmean(after) - before_mean)
+            self.bounds[key] = max(noise, self.tolerance * abs(before_mean))
+        self.bounds["win_rate"] = max(self.bounds["win_rate"], 1 / self.window)
+        if all(self.changes[key] <= self.bounds[key] for key in self.changes):
+            self.stable += 1
+        else:
+            self.stable = 0
+        if self.stable >= self.patience and len(self.history) >= self.min_episodes:
+            return "converged"
+        return None
+
 # -------------------------
 # Simulation Class with RL Training over Multiple Episodes
 # -------------------------
 class Simulation:
     def __init__(self, game_map, attacker_strategy, defender_positions,
-                 attacker_params=None, defender_params=None, max_ticks=1000):
+                 attacker_params=None, defender_params=None, max_ticks=1000,
+                 visibility_index=True, seed=None, recording=None, episode_summaries=False,
+                 q_state=None, orientation_buckets=4, shared_q=True, q_max_rows=None,
+                 num_episodes=NUM_EPISODES, convergence=None, spatial_index=True, coverage="ray",
+                 series=False, profiler=None):
+        if coverage not in COVERAGE_MODES:
+            raise ValueError(f"Unknown coverage mode: {coverage}")
         self.map = game_map
+        self.coverage = coverage
+        # Add per-tick metric series (e.g. attacker spread) to recorded results.
+        self.series = series
+        self.recording = recording if recording is not None else RecordingPolicy()
+        self.episode_summaries = episode_summaries
+        self.rewards = {"attackers": 0.0, "defenders": 0.0}
+        self.q_delta = 0.0
+        self.q_updates = 0
+        # Wall time spent computing episode statistics in the last run, for server metrics.
+        self.stats_seconds = 0.0
+        # A seed gives the simulation its own generator so runs are reproducible;
+        # without one it draws from the shared random module as before.
+        self.seed = seed
+        self.rng = random.Random(seed) if seed is not None else random
         self.strategy = attacker_strategy
         self.attackers = []
         self.defenders = []
@@ -302,29 +671,84 @@ class Simulation:
         for i, pos in enumerate(attacker_positions):
             if isinstance(pos, (list, tuple)) and len(pos) >= 2:
                 x, y = pos[0], pos[1]
-                orientation = pos[2] if len(pos) >= 3 else random.uniform(0, 2 * math.pi)
+                orientation = pos[2] if len(pos) >= 3 else self.rng.uniform(0, 2 * math.pi)
             else:
                 raise ValueError("Invalid attacker position")
             params = attacker_params.copy()
             params["orientation"] = orientation
-            self.attackers.append(Attacker(id=i, x=x, y=y, params=params))
+            self.attackers.append(Attacker(id=i, x=x, y=y, params=params, rng=self.rng))
 
         for i, pos in enumerate(defender_positions):
             if isinstance(pos, (list, tuple)) and len(pos) >= 2:
                 x, y = pos[0], pos[1]
-                orientation = pos[2] if len(pos) >= 3 else random.uniform(0, 2 * math.pi)
+                orientation = pos[2] if len(pos) >= 3 else self.rng.uniform(0, 2 * math.pi)
             else:
                 raise ValueError("Invalid defender position")
             if any(a.x == x and a.y == y for a in self.attackers):
                 raise ValueError(f"Defender starting cell ({x}, {y}) collides with an attacker.")
             params = defender_params.copy()
             params["orientation"] = orientation
-            self.defenders.append(Defender(id=i, x=x, y=y, params=params))
+            self.defenders.append(Defender(id=i, x=x, y=y, params=params, rng=self.rng))
 
         # Save the initial positions so we can reset without losing Q-values.
         self.initial_attacker_positions = [(a.x, a.y) for a in self.attackers]
         self.initial_defender_positions = [(d.x, d.y) for d in self.defenders]
         self.states = []
+        # Training-only episodes handed to play_episodes() at a time.
+        self.train_batch = 1
+        # Episodes played by run() and stream(); exploration and Q-updates
+        # are switched off together by set_learning(False).
+        self.num_episodes = num_episodes
+        self.convergence = convergence
+        self.stop_reason = None
+        self.epsilon = 0.1
+        self.learning = True
+
+        # State-conditioned Q-learning: "cell" or "cell_orientation" states,
+        # one table per team when shared_q, otherwise one per agent.
+        self.q_state = q_state
+        self.shared_q = shared_q
+        self.q_tables = {"attacker": [], "defender": []}
+        self.state_encoder = None
+        if q_state is not None:
+            self.attach_q_tables(q_state, orientation_buckets, shared_q, q_max_rows)
+
+        # Line-of-sight lookups go through the map's index when enabled.
+        agents = self.attackers + self.defenders
+        if visibility_index and agents:
+            self.map.enable_visibility_index(max(agent.vision_range for agent in agents))
+        if coverage == "cone" and self.attackers:
+            # Cone coverage reads the same index; fail now rather than after the run.
+            from view_coverage import visibility_index as cone_visibility_index
+            cone_visibility_index(self.map, max(a.vision_range for a in self.attackers))
+
+        # Proximity queries go through per-team bucket grids sized to the
+        # largest vision range, so each query touches at most 3x3 blocks.
+        self.attacker_index = None
+        self.defender_index = None
+        if spatial_index and agents:
+            bucket_size = int(math.ceil(max(agent.vision_range for agent in agents)))
+            self.attacker_index = SpatialIndex(bucket_size)
+            self.defender_index = SpatialIndex(bucket_size)
+
+        # Optional Profiler; its counters are shared with every agent.
+        self.profiler = profiler
+        if profiler is not None:
+            for agent in agents:
+                agent.counters = profiler.counters
+
+    def attach_q_tables(self, q_state, orientation_buckets, shared_q, max_rows):
+        from qtable import QTable, StateEncoder
+        if q_state not in ("cell", "cell_orientation"):
+            raise ValueError(f"Unknown Q-learning state: {q_state}")
+        buckets = orientation_buckets if q_state == "cell_orientation" else 1
+        self.state_encoder = StateEncoder(self.map.width, self.map.height, buckets)
+        for role, agents in (("attacker", self.attackers), ("defender", self.defenders)):
+            count = 1 if shared_q else len(agents)
+            self.q_tables[role] = [QTable(self.state_encoder.num_states, len(RLAgent.ACTIONS), max_rows)
+                                   for _ in range(count)]
+            for i, agent in enumerate(agents):
+                agent.attach_q_table(self.q_tables[role][0 if shared_q else i], self.state_encoder)
 
     def attackers_alive(self):
         return any(a.alive for a in self.attackers)
@@ -348,6 +772,9 @@ class Simulation:
     def reset_environment(self):
         self.tick = 0
         self.states = []
+        self.rewards = {"attackers": 0.0, "defenders": 0.0}
+        self.q_delta = 0.0
+        self.q_updates = 0
         # Reset attackers
         for i, a in enumerate(self.attackers):
             start = self.initial_attacker_positions[i]
@@ -362,101 +789,396 @@ class Simulation:
             d.x, d.y = start
             d.alive = True
             d.starting_position = start
-        self.states.append(self.get_state())
+        if self.attacker_index is not None:
+            self.attacker_index.rebuild(self.attackers)
+            self.defender_index.rebuild(self.defenders)
 
-    def run_episode(self):
+    def nearby_defenders(self, agent):
+        # Alive defenders that might be within agent's vision range, in list order.
+        if self.defender_index is None:
+            return [d for d in self.defenders if d.alive]
+        return self.defender_index.nearby(agent.x, agent.y, agent.vision_range)
+
+    def nearby_attackers(self, agent):
+        if self.attacker_index is None:
+            return [a for a in self.attackers if a.alive]
+        return self.attacker_index.nearby(agent.x, agent.y, agent.vision_range)
+
+    def iter_episode(self, keep_states=True, tick_stride=1):
+        """
+        Run one episode, yielding the state after reset and after every
+        tick as soon as it is produced. Statistics are accumulated on the
+        fly, so with keep_states=False no trajectory is held in memory.
+        With tick_stride > 1 only every Nth state (and the last) is kept.
+        """
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin_episode()
+        self.reset_environment()
+        self.accumulator = StatisticsAccumulator(self.map, self.coverage,
+                                                 [(a.vision_range, a.view_angle) for a in self.attackers],
+                                                 profiler)
+        state = self.get_state()
+        while True:
+            if profiler is not None:
+                profiler.lap("snapshot")
+            self.accumulator.feed(state)
+            if keep_states and self.tick % tick_stride == 0:
+                self.states.append(state)
+            if profiler is not None:
+                profiler.lap("stats.feed")
+            yield state
+            if profiler is not None:
+                profiler.mark()
+            if not (self.attackers_alive() and self.defenders_alive() and self.tick < self.max_ticks):
+                break
+            self.tick += 1
+            self.update()
+            state = self.get_state()
+        if keep_states and self.tick % tick_stride != 0:
+            self.states.append(state)
+        if profiler is not None:
+            profiler.end_episode(self.tick)
+
+    def play_episode(self):
+        # Training-only episode: no snapshots and no statistics.
+        if self.profiler is not None:
+            self.profiler.begin_episode()
         self.reset_environment()
         while self.attackers_alive() and self.defenders_alive() and self.tick < self.max_ticks:
             self.tick += 1
             self.update()
-            self.states.append(self.get_state())
+        if self.profiler is not None:
+            self.profiler.end_episode(self.tick)
+
+    def play_episodes(self, episodes):
+        """Play training-only episodes (numbered by episodes) and return their summaries."""
+        played = []
+        for ep in episodes:
+            self.play_episode()
+            played.append(self.episode_summary(ep))
+        return played
+
+    def record_q_delta(self, delta):
+        self.q_delta += abs(delta)
+        self.q_updates += 1
+
+    def episode_summary(self, episode):
+        return {
+            "episode": episode,
+            "ticks": self.tick,
+            "attackers_win": not self.defenders_alive(),
+            "attacker_reward": self.rewards["attackers"],
+            "defender_reward": self.rewards["defenders"],
+            "q_delta": self.q_delta / self.q_updates if self.q_updates else 0.0,
+        }
+
+    def episode_result(self):
         outcome = {"attackers_win": not self.defenders_alive()}
-        stats = Statistics(self.states, self.map)
-        return {"map": self.map.grid, "states": self.states, "outcome": outcome, "stats": stats.stats()}
+        if self.profiler is not None:
+            self.profiler.mark()
+        start = time.perf_counter()
+        result = {"map": self.map.to_list(), "states": self.states, "outcome": outcome, "stats": self.accumulator.stats()}
+        self.stats_seconds += time.perf_counter() - start
+        if self.series:
+            result["series"] = self.accumulator.series()
+        return result
+
+    def run_episode(self):
+        for _ in self.iter_episode():
+            pass
+        return self.episode_result()
 
-    def run_training(self, num_episodes):
+    def stream(self, num_episodes=None):
+        """
+        Train for all but the last episode, then yield streaming events:
+        the map, every state of the final episode as it is simulated, and
+        a closing result with the outcome and statistics.
+        """
+        if num_episodes is None:
+            num_episodes = self.num_episodes
+        yield {"type": "map", "map": self.map.to_list()}
+        self.run_training(num_episodes - 1, policy=RecordingPolicy("none"), summaries=False)
+        for state in self.iter_episode(keep_states=False):
+            yield {"type": "state", "state": state}
+        result = self.episode_result()
+        event = {"type": "result", "outcome": result["outcome"], "stats": result["stats"]}
+        if "series" in result:
+            event["series"] = result["series"]
+        if self.profiler is not None:
+            event["profile"] = self.profiler.report()
+        yield event
+
+    def run_training(self, num_episodes, callback=None, policy=None, summaries=None, monitor=None):
+        """
+        Train for num_episodes and return the final episode's result.
+        policy (a RecordingPolicy, default self.recording) picks which
+        episodes record states and statistics; the rest only step the
+        simulation. With summaries, per-episode ticks, winner, reward
+        totals and mean Q-value change are returned under "episodes".
+        callback(done, total) runs after every episode; raising from it
+        aborts training. monitor (a ConvergenceMonitor, default
+        self.convergence) may end training early; the final episode is then
+        recorded as usual and "stop_reason" and "episodes_run" are added.
+        """
+        policy = policy if policy is not None else self.recording
+        summaries = self.episode_summaries if summaries is None else summaries
+        monitor = monitor if monitor is not None else self.convergence
+        self.summaries = []
+        self.recorded_episodes = []
+        self.stop_reason = None
+        self.stats_seconds = 0.0
+        if monitor is not None:
+            monitor.start()
         final_result = None
-        for ep in range(num_episodes):
-            final_result = self.run_episode()
+        played = []
+        ep = 0
+        while ep < num_episodes and self.stop_reason is None:
+            if policy.records(ep, num_episodes):
+                final_result = self.record_episode(ep, policy.tick_stride)
+                if ep < num_episodes - 1:
+                    # The grid is the same for every episode and already sits at the top level.
+                    recorded = {key: value for key, value in final_result.items() if key != "map"}
+                    self.recorded_episodes.append(dict(recorded, episode=ep))
+                played = [self.episode_summary(ep)]
+            else:
+                # Consecutive training-only episodes go out in batches of up to train_batch.
+                batch = [ep]
+                while (len(batch) < self.train_batch and batch[-1] + 1 < num_episodes
+                       and not policy.records(batch[-1] + 1, num_episodes)):
+                    batch.append(batch[-1] + 1)
+                played = self.play_episodes(batch)
+                final_result = None
             # Optionally, print training progress:
             # print(f"Episode {ep+1}/{num_episodes} complete; ticks: {self.tick}")
+            for summary in played:
+                if summaries:
+                    self.summaries.append(summary)
+                if callback is not None:
+                    callback(summary["episode"] + 1, num_episodes)
+                if monitor is not None and self.stop_reason is None:
+                    self.stop_reason = monitor.observe(summary)
+            ep += len(played)
+        if self.stop_reason is not None and policy.mode != "none":
+            if final_result is None:
+                # Stopped before the planned final episode: record one now.
+                final_result = self.record_episode(ep, policy.tick_stride)
+                played = [self.episode_summary(ep)]
+                if summaries:
+                    self.summaries.append(played[0])
+                ep += 1
+            elif self.recorded_episodes and self.recorded_episodes[-1]["episode"] == ep - 1:
+                self.recorded_episodes.pop()
+        if final_result is None:
+            final_result = {"map": self.map.to_list(), "states": [],
+                            "outcome": {"attackers_win": played[-1]["attackers_win"] if played else not self.defenders_alive()},
+                            "stats": None}
+        if summaries:
+            final_result["episodes"] = self.summaries
+        if policy.mode == "every":
+            final_result["recorded_episodes"] = self.recorded_episodes
+        if monitor is not None:
+            final_result["stop_reason"] = self.stop_reason or "episodes"
+            final_result["episodes_run"] = ep
+        if self.profiler is not None:
+            final_result["profile"] = self.profiler.report()
         return final_result
 
+    def record_episode(self, episode, tick_stride=1):
+        for _ in self.iter_episode(tick_stride=tick_stride):
+            pass
+        return self.episode_result()
+
     # Add a run() method so that simulation.run() is available.
-    def run(self):
-        return self.run_training(NUM_EPISODES)
+    def run(self, callback=None):
+        return self.run_training(self.num_episodes, callback)
+
+    def set_learning(self, enabled):
+        # Disabled: greedy actions and frozen Q-values, for inference with a trained policy.
+        self.learning = enabled
+        self.epsilon = 0.1 if enabled else 0.0
+
+    def get_q_arrays(self):
+        """
+        Learned Q-values by role ("attacker", "defender"), each a list of
+        num_agents x 4 rows, or of dense Q-table value arrays when q_state is set.
+        """
+        if self.q_state is not None:
+            for tables in self.q_tables.values():
+                if any(not table.dense for table in tables):
+                    raise ValueError("Only dense Q-tables can be exported; use a smaller state space.")
+            return {role: [table.values for table in tables] for role, tables in self.q_tables.items()}
+        return {
+            role: [[[agent.q_values[action] for action in RLAgent.ACTIONS] for agent in agents]]
+            for role, agents in (("attacker", self.attackers), ("defender", self.defenders))
+        }
+
+    def set_q_arrays(self, arrays, copy=True):
+        """
+        Load values shaped like get_q_arrays(). With copy=False Q-tables use
+        the given arrays directly (e.g. read-only memory maps for inference).
+        """
+        if self.q_state is not None:
+            for role, tables in self.q_tables.items():
+                for table, values in zip(tables, arrays[role]):
+                    table.load(values, copy)
+            return
+        for role, agents in (("attacker", self.attackers), ("defender", self.defenders)):
+            for agent, row in zip(agents, arrays[role][0]):
+                agent.q_values = dict(zip(RLAgent.ACTIONS, (float(q) for q in row)))
+
+    def visibility_matrix(self):
+        """
+        Who sees whom at the start of the tick: attacker id -> defenders it
+        can see and defender id -> attackers it can see, both in id order.
+        Nobody moves until the movement phase, and attackers only consult
+        it before their own move while defenders are still in place, so
+        the only invalidation needed within a tick is dropping dead agents.
+        """
+        game_map = self.map
+        attacker_sees = {
+            a.id: [d for d in self.nearby_defenders(a) if a.can_see(d, game_map)]
+            for a in self.attackers if a.alive
+        }
+        defender_sees = {
+            d.id: [a for a in self.nearby_attackers(d) if d.can_see(a, game_map)]
+            for d in self.defenders if d.alive
+        }
+        return attacker_sees, defender_sees
 
     def update(self):
+        profiler = self.profiler
         engaged_attackers = set()
         engaged_defenders = set()
+        if profiler is not None:
+            profiler.mark()
+        attacker_sees, defender_sees = self.visibility_matrix()
+        if profiler is not None:
+            profiler.lap("visibility")
 
         # --- Engagement Phase ---
         for attacker in self.attackers:
             if not attacker.alive or attacker.id in engaged_attackers:
                 continue
-            visible_defenders = [d for d in self.defenders if d.alive and d.id not in engaged_defenders and attacker.can_see(d, self.map)]
+            visible_defenders = [d for d in attacker_sees[attacker.id] if d.alive and d.id not in engaged_defenders]
             if visible_defenders:
                 defender = min(visible_defenders, key=lambda d: attacker.distance_to(d))
-                if defender.can_see(attacker, self.map):
-                    a_reaction = random.uniform(0, attacker.reaction)
-                    d_reaction = random.uniform(0, defender.reaction)
+                if attacker in defender_sees[defender.id]:
+                    a_reaction = self.rng.uniform(0, attacker.reaction)
+                    d_reaction = self.rng.uniform(0, defender.reaction)
                     if a_reaction < d_reaction:
-                        defender.alive = False
+                        defender.die()
                         attacker.score += 5
                     else:
-                        attacker.alive = False
+                        attacker.die()
                         attacker.score -= 10
                     engaged_attackers.add(attacker.id)
                     engaged_defenders.add(defender.id)
                 else:
-                    defender.alive = False
+                    defender.die()
                     attacker.score += 5
                     engaged_attackers.add(attacker.id)
                     engaged_defenders.add(defender.id)
         for defender in self.defenders:
             if not defender.alive or defender.id in engaged_defenders:
                 continue
-            visible_attackers = [a for a in self.attackers if a.alive and a.id not in engaged_attackers and defender.can_see(a, self.map)]
+            visible_attackers = [a for a in defender_sees[defender.id] if a.alive and a.id not in engaged_attackers]
             if visible_attackers:
                 attacker = min(visible_attackers, key=lambda a: defender.distance_to(a))
-                if not attacker.can_see(defender, self.map):
-                    attacker.alive = False
+                if defender not in attacker_sees[attacker.id]:
+                    attacker.die()
                     attacker.score -= 10
                     engaged_defenders.add(defender.id)
                     engaged_attackers.add(attacker.id)
+        if profiler is not None:
+            profiler.lap("engagement")
         # --- Movement Phase using RL ---
         for attacker in self.attackers:
             if not attacker.alive:
                 continue
             # Skip movement if any defender is visible.
-            if any(attacker.can_see(d, self.map) for d in self.defenders if d.alive):
+            if any(d.alive for d in attacker_sees[attacker.id]):
                 continue
-            action = attacker.choose_action(epsilon=0.1)
+            action = attacker.choose_action(epsilon=self.epsilon)
             reward = attacker.perform_action(action, self.map, self.tick)
-            attacker.update_q(reward, alpha=0.1, gamma=0.9)
+            if profiler is not None:
+                profiler.lap("movement")
+            if self.learning:
+                self.record_q_delta(attacker.update_q(reward, alpha=0.1, gamma=0.9))
+                if profiler is not None:
+                    profiler.lap("q_update")
+            self.rewards["attackers"] += reward
         for defender in self.defenders:
             if not defender.alive:
                 continue
-            action = defender.choose_action(epsilon=0.1)
+            action = defender.choose_action(epsilon=self.epsilon)
             reward = defender.perform_action(action, self.map)
-            defender.update_q(reward, alpha=0.1, gamma=0.9)
+            if profiler is not None:
+                profiler.lap("movement")
+            if self.learning:
+                self.record_q_delta(defender.update_q(reward, alpha=0.1, gamma=0.9))
+                if profiler is not None:
+                    profiler.lap("q_update")
+            self.rewards["defenders"] += reward
 
 # -------------------------
 # Statistics Class
 # -------------------------
+def coverage_count(game_map, attackers):
+    """Number of cells seen this tick along each alive attacker's axis-aligned ray."""
+    positions = set()
+    rows = game_map.height
+    cols = game_map.width
+    for a in attackers:
+        x, y, angle = a["x"], a["y"], a["orientation"]
+        if not a["alive"] or not (0 <= x < cols and 0 <= y < rows):
+            continue
+        normalized_angle = angle % (2 * math.pi)
+        if math.isclose(normalized_angle, 0) or math.isclose(normalized_angle, 2 * math.pi):
+            for i in range(x + 1, cols):
+                if game_map.grid[y][i] == 1:
+                    break
+                positions.add((y, i))
+        elif math.isclose(normalized_angle, math.pi / 2):
+            for j in range(y + 1, rows):
+                if game_map.grid[j][x] == 1:
+                    break
+                positions.add((j, x))
+        elif math.isclose(normalized_angle, math.pi):
+            for i in range(x - 1, -1, -1):
+                if game_map.grid[y][i] == 1:
+                    break
+                positions.add((y, i))
+        elif math.isclose(normalized_angle, 3 * math.pi / 2):
+            for j in range(y - 1, -1, -1):
+                if game_map.grid[j][x] == 1:
+                    break
+                positions.add((j, x))
+    return len(positions)
+
 class Statistics:
-    def __init__(self, states, map_obj):
+    """
+    Summary statistics of a recorded episode. coverage "ray" counts the
+    cells along each attacker's axis-aligned facing ray; "cone" counts the
+    cells inside each attacker's view cone and line of sight, which needs
+    attacker_params, a (vision_range, view_angle) pair per attacker.
+    With a profiler, stats() times its coverage, spread and per-attacker
+    parts as "stats.*" phases.
+    """
+    def __init__(self, states, map_obj, coverage="ray", attacker_params=None, profiler=None):
+        if coverage not in COVERAGE_MODES:
+            raise ValueError(f"Unknown coverage mode: {coverage}")
         self.states = states
         self.attackers = len(self.states[0]["attackers"])
         self.map = map_obj
+        self.coverage = coverage
+        self.attacker_params = attacker_params
+        self.profiler = profiler
 
     def unique_cells_visited(self, id):
-        coords = []
+        coords = set()
         for state in self.states:
-            x_cur = state["attackers"][id]["x"]
-            y_cur = state["attackers"][id]["y"]
-            if [x_cur, y_cur] not in coords:
-                coords.append([x_cur, y_cur])
+            coords.add((state["attackers"][id]["x"], state["attackers"][id]["y"]))
         return len(coords)
 
     def rounds_survived(self, index):
@@ -494,41 +1216,11 @@ class Statistics:
         return -1
 
     def coverage_statistics(self):
-        positions = set()
-        def viewable_squares(x, y, angle, alive):
-            if not alive:
-                return
-            rows = self.map.height
-            cols = self.map.width
-            if not (0 <= x < cols and 0 <= y < rows):
-                return
-            normalized_angle = angle % (2 * math.pi)
-            if math.isclose(normalized_angle, 0) or math.isclose(normalized_angle, 2 * math.pi):
-                for i in range(x + 1, cols):
-                    if self.map.grid[y][i] == 1:
-                        break
-                    positions.add((y, i))
-            elif math.isclose(normalized_angle, math.pi / 2):
-                for j in range(y + 1, rows):
-                    if self.map.grid[j][x] == 1:
-                        break
-                    positions.add((j, x))
-            elif math.isclose(normalized_angle, math.pi):
-                for i in range(x - 1, -1, -1):
-                    if self.map.grid[y][i] == 1:
-                        break
-                    positions.add((y, i))
-            elif math.isclose(normalized_angle, 3 * math.pi / 2):
-                for j in range(y - 1, -1, -1):
-                    if self.map.grid[j][x] == 1:
-                        break
-                    positions.add((j, x))
-        coverages = []
-        for state in self.states:
-            for a in state["attackers"]:
-                viewable_squares(a["x"], a["y"], a["orientation"], a["alive"])
-            coverages.append(len(positions))
-            positions = set()
+        if self.coverage == "cone":
+            from view_coverage import state_coverage
+            coverages = state_coverage(self.map, self.states, self.attacker_params)
+        else:
+            coverages = [coverage_count(self.map, state["attackers"]) for state in self.states]
         return (statistics.mean(coverages[:-1]), statistics.variance(coverages[:-1]))
 
     def total_distance_travelled(self, id):
@@ -545,39 +1237,37 @@ class Statistics:
             distance += abs(x1 - x0) + abs(y1 - y0)
         return distance
 
+    def spread_statistics(self):
+        # Pairwise attacker distances, vectorized over the whole trajectory.
+        from spread import attacker_columns, pairwise_spread
+        columns = attacker_columns(self.states)
+        return pairwise_spread(columns[..., 0], columns[..., 1], columns[..., 3])
+
     def distance_between_attacker(self):
-        from math import sqrt
-        total_dist = 0
-        total_dist_squared = 0
-        num_dists = 0
-        for state in self.states:
-            attackers = state["attackers"]
-            for i in range(len(attackers) - 1):
-                if attackers[i]["alive"]:
-                    for j in range(i + 1, len(attackers)):
-                        if attackers[j]["alive"]:
-                            dx = attackers[i]["x"] - attackers[j]["x"]
-                            dy = attackers[i]["y"] - attackers[j]["y"]
-                            d = sqrt(dx * dx + dy * dy)
-                            total_dist += d
-                            total_dist_squared += d * d
-                            num_dists += 1
-        if num_dists == 0:
-            return (-1, -1)
-        avg = total_dist / num_dists
-        avg2 = total_dist_squared / num_dists
-        return (avg, avg2 - (avg ** 2))
+        spread = self.spread_statistics()
+        return (spread["avg"], spread["var"])
+
+    def series(self):
+        return {"spread": self.spread_statistics()["series"]}
 
     def stats(self):
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.mark()
+        coverage_avg, coverage_var = self.coverage_statistics()
+        if profiler is not None:
+            profiler.lap("stats.coverage")
+        spread = self.spread_statistics()
+        if profiler is not None:
+            profiler.lap("stats.spread")
         a = {
             "attacker_first_blood": self.first_blood_attacker(),
             "defender_first_blood": self.first_blood_defender(),
-            "coverage_avg": self.coverage_statistics()[0],
-            "coverage_var": self.coverage_statistics()[1],
+            "coverage_avg": coverage_avg,
+            "coverage_var": coverage_var,
         }
-        spread_avg, spread_var = self.distance_between_attacker()
-        a["spread_avg"] = spread_avg
-        a["spread_var"] = spread_var
+        for key in ("avg", "var", "p05", "median", "p95"):
+            a[f"spread_{key}"] = spread[key]
         distance_travelled = []
         displacement = []
         rounds_survived = []
@@ -594,8 +1284,198 @@ class Statistics:
         a["mean_unique_cells_visited"] = statistics.mean(
             [self.unique_cells_visited(i) for i in range(self.attackers)]
         )
+        if profiler is not None:
+            profiler.lap("stats.agents")
         return a
 
+# -------------------------
+# Streaming Statistics Accumulator
+# -------------------------
+class StatisticsAccumulator:
+    """
+    Single-pass counterpart of Statistics. Feed it every state as the
+    episode runs; stats() returns the same report without the trajectory
+    being kept, using per-attacker running totals and one coverage count
+    per tick. Spread is accumulated the same way (see SpreadAccumulator).
+    Cone coverage is computed in one batch by stats(), so with coverage
+    "cone" the attackers' positions, orientations and alive flags are also
+    kept per tick.
+    """
+    def __init__(self, map_obj, coverage="ray", attacker_params=None, profiler=None):
+        if coverage not in COVERAGE_MODES:
+            raise ValueError(f"Unknown coverage mode: {coverage}")
+        self.map = map_obj
+        self.coverage = coverage
+        self.attacker_params = attacker_params
+        self.profiler = profiler
+        from spread import SpreadAccumulator
+        self.spread = SpreadAccumulator()
+        self.rows = [] if coverage == "cone" else None
+        self.ticks = 0
+        self.attacker_first_blood = -1
+        self.defender_first_blood = -1
+        self.coverages = []
+        self._spread = None
+
+    def _start(self, attackers):
+        self.attackers = len(attackers)
+        self.start = [(a["x"], a["y"]) for a in attackers]
+        self.last = list(self.start)
+        self.visited = [set() for _ in attackers]
+        self.rounds = [0] * self.attackers
+        self.surviving = [True] * self.attackers
+        self.distance = [0] * self.attackers
+        self.travelling = [True] * self.attackers
+
+    def feed(self, state):
+        attackers = state["attackers"]
+        if self.ticks == 0:
+            self._start(attackers)
+        self.ticks += 1
+
+        if self.attacker_first_blood == -1 and any(not a["alive"] for a in attackers):
+            self.attacker_first_blood = self.ticks
+        if self.defender_first_blood == -1 and any(not d["alive"] for d in state["defenders"]):
+            self.defender_first_blood = self.ticks
+        if self.coverage == "ray":
+            self.coverages.append(coverage_count(self.map, attackers))
+        self.spread.feed([a["x"] for a in attackers], [a["y"] for a in attackers], [a["alive"] for a in attackers])
+        if self.rows is not None:
+            self.rows.append([(a["x"], a["y"], a["orientation"], a["alive"]) for a in attackers])
+        self._spread = None
+
+        for i, a in enumerate(attackers):
+            x, y, alive = a["x"], a["y"], a["alive"]
+            self.visited[i].add((x, y))
+            if self.surviving[i]:
+                if alive:
+                    self.rounds[i] += 1
+                else:
+                    self.surviving[i] = False
+            if self.ticks > 1 and self.travelling[i]:
+                if alive:
+                    self.distance[i] += abs(x - self.last[i][0]) + abs(y - self.last[i][1])
+                else:
+                    self.travelling[i] = False
+            self.last[i] = (x, y)
+
+    def _columns(self):
+        import numpy as np
+        return np.array(self.rows, dtype=float).reshape(len(self.rows), -1, 4)
+
+    def spread_statistics(self):
+        if self._spread is None:
+            self._spread = self.spread.result()
+        return self._spread
+
+    def series(self):
+        return {"spread": self.spread_statistics()["series"]}
+
+    def stats(self):
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.mark()
+        if self.coverage == "cone":
+            from view_coverage import cone_coverage
+            columns = self._columns()
+            vision_range = [params[0] for params in self.attacker_params]
+            view_angle = [params[1] for params in self.attacker_params]
+            self.coverages = cone_coverage(self.map, columns[..., 0], columns[..., 1], columns[..., 2],
+                                           columns[..., 3], vision_range, view_angle).tolist()
+        a = {
+            "attacker_first_blood": self.attacker_first_blood,
+            "defender_first_blood": self.defender_first_blood,
+            "coverage_avg": statistics.mean(self.coverages[:-1]),
+            "coverage_var": statistics.variance(self.coverages[:-1]),
+        }
+        if profiler is not None:
+            profiler.lap("stats.coverage")
+        spread = self.spread_statistics()
+        if profiler is not None:
+            profiler.lap("stats.spread")
+        for key in ("avg", "var", "p05", "median", "p95"):
+            a[f"spread_{key}"] = spread[key]
+        displacement = [abs(x1 - x0) + abs(y1 - y0) for (x0, y0), (x1, y1) in zip(self.start, self.last)]
+        a["distance_travelled_avg"] = statistics.mean(self.distance)
+        a["distance_travelled_var"] = statistics.variance(self.distance)
+        a["displacement_avg"] = statistics.mean(displacement)
+        a["displacement_var"] = statistics.variance(displacement)
+        a["rounds_survived_avg"] = statistics.mean(self.rounds)
+        a["rounds_survived_var"] = statistics.variance(self.rounds)
+        a["mean_unique_cells_visited"] = statistics.mean([len(cells) for cells in self.visited])
+        if profiler is not None:
+            profiler.lap("stats.agents")
+        return a
+
+# -------------------------
+# Building a Simulation from a Request Payload
+# -------------------------
+SIMULATION_ENGINES = ("object", "vector")
+
+def create_map(config):
+    grid = config.get("grid", [[0 for _ in range(10)] for _ in range(10)])
+    if config.get("engine", "object") == "vector":
+        from array_map import ArrayMap
+        return ArrayMap(grid)
+    return Map(grid)
+
+def create_simulation(config, game_map=None):
+    """
+    Build a simulation from a /simulate style payload. "engine" picks the
+    implementation: "object" (one Python object per agent) or "vector"
+    (NumPy structure-of-arrays engine with the same result format); the
+    vector engine also takes "num_envs" to train that many episodes in
+    lockstep. "episodes" sets the training budget, and "convergence" (a
+    dict of ConvergenceMonitor options, or true) and "time_budget" (seconds)
+    let training stop early. "coverage" picks the coverage metric ("ray"
+    or "cone", see Statistics) and "series" adds per-tick series to the
+    result. "profile" (true, or {"memory": true}) adds a Profiler report
+    under "profile". Passing game_map reuses an existing map and
+    its visibility index, and "seed" makes the run reproducible.
+    """
+    attacker_positions = [tuple(pos) for pos in config.get("attacker_positions", [(0, 0), (0, 9)])]
+    defender_positions = [tuple(pos) for pos in config.get("defender_positions", [(3, 7), (2, 7), (8, 6)])]
+    attacker_params = config.get("attacker_params", DEFAULT_ATTACKER_PARAMS)
+    defender_params = config.get("defender_params", DEFAULT_DEFENDER_PARAMS)
+    max_ticks = config.get("max_ticks", 1000)
+    seed = config.get("seed")
+    recording = RecordingPolicy.from_config(config.get("recording"))
+    episode_summaries = bool(config.get("episode_summaries", False))
+    q_learning = {
+        "q_state": config.get("q_state"),
+        "orientation_buckets": int(config.get("orientation_buckets", 4)),
+        "shared_q": bool(config.get("shared_q", True)),
+    }
+    num_envs = int(config.get("num_envs", 1))
+    num_episodes = int(config.get("episodes", NUM_EPISODES))
+    coverage = config.get("coverage", "ray")
+    series = bool(config.get("series", False))
+    profiler = Profiler.from_config(config.get("profile"))
+    if num_episodes < 1:
+        raise ValueError("episodes must be at least 1.")
+    time_budget = config.get("time_budget")
+    convergence = ConvergenceMonitor.from_config(config.get("convergence"),
+                                                 float(time_budget) if time_budget is not None else None)
+
+    engine = config.get("engine", "object")
+    extra = {}
+    if engine == "object":
+        simulation_class = Simulation
+        if num_envs > 1:
+            raise ValueError("num_envs > 1 requires the vector engine.")
+    elif engine == "vector":
+        from vector_engine import VectorSimulation as simulation_class
+        extra["num_envs"] = num_envs
+    else:
+        raise ValueError(f"Unknown simulation engine: {engine}")
+    if game_map is None:
+        game_map = create_map(config)
+    return simulation_class(game_map, Strategy(attacker_positions), defender_positions,
+                            attacker_params, defender_params, max_ticks=max_ticks, seed=seed,
+                            recording=recording, episode_summaries=episode_summaries, **q_learning,
+                            num_episodes=num_episodes, convergence=convergence, coverage=coverage,
+                            series=series, profiler=profiler, **extra)
+
 # -------------------------
 # Main Execution Example (for testing)
 # -------------------------
@@ -0,0 +1,139 @@
+import math
+
+import numpy as np
+
+def attacker_columns(states):
+    """(ticks, attackers, 4) float array of x, y, orientation and alive from state dicts."""
+    return np.array([[(a["x"], a["y"], a["orientation"], a["alive"]) for a in state["attackers"]]
+                     for state in states], dtype=float).reshape(len(states), -1, 4)
+
+# Percentiles reported by spread statistics.
+SPREAD_PERCENTILES = (5, 50, 95)
+
+def _percentiles(squared, counts):
+    """
+    Linear-interpolation percentiles (np.percentile's default) of the
+    distances sqrt(squared[k]), each occurring counts[k] times, with
+    squared sorted ascending.
+    """
+    ends = np.cumsum(counts)
+    n = int(ends[-1])
+    result = []
+    for q in SPREAD_PERCENTILES:
+        position = (n - 1) * q / 100
+        below = math.floor(position)
+        low, high = np.sqrt(squared[np.searchsorted(ends, [below, min(below + 1, n - 1)], side="right")]).tolist()
+        result.append(low + (high - low) * (position - below))
+    return result
+
+def _summary(total, total_squared, count, percentiles, series):
+    if not count:
+        return {"avg": -1, "var": -1, "p05": -1, "median": -1, "p95": -1, "series": series}
+    avg = total / count
+    avg2 = total_squared / count
+    p05, median, p95 = percentiles
+    return {
+        "avg": avg,
+        "var": avg2 - (avg ** 2),
+        "p05": p05,
+        "median": median,
+        "p95": p95,
+        "series": series,
+    }
+
+def pairwise_spread(x, y, alive):
+    """
+    Distances between every pair of alive attackers, from (ticks,
+    attackers) arrays. avg and var cover all pairs of all ticks and are
+    summed in the same order as the original per-state loop, so they match
+    it exactly; p05/median/p95 are percentiles of the same distances and
+    series holds the mean per tick (None with fewer than two alive).
+    Without any pair, avg/var and the percentiles are -1.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    alive = np.asarray(alive, dtype=bool)
+    attackers = x.shape[1] if x.ndim == 2 else 0
+    i, j = np.triu_indices(attackers, 1)
+    dx = x[:, i] - x[:, j]
+    dy = y[:, i] - y[:, j]
+    squared = dx * dx + dy * dy
+    distance = np.sqrt(squared)
+    paired = alive[:, i] & alive[:, j]
+    counts = paired.sum(axis=1)
+    # Row-contiguous, so each tick is summed exactly as SpreadAccumulator sums it.
+    sums = np.ascontiguousarray(np.where(paired, distance, 0.0)).sum(axis=1)
+    series = [float(s / c) if c else None for s, c in zip(sums.tolist(), counts.tolist())]
+
+    values = distance[paired]
+    if not len(values):
+        return _summary(0.0, 0.0, 0, None, series)
+    # cumsum adds left to right, like the scalar loop.
+    total = float(np.cumsum(values)[-1])
+    total_squared = float(np.cumsum(values * values)[-1])
+    return _summary(total, total_squared, len(values), _percentiles(*np.unique(squared[paired], return_counts=True)), series)
+
+class SpreadAccumulator:
+    """
+    pairwise_spread fed one tick at a time in memory that does not grow
+    with the pairs seen: avg and var come from running totals added in the
+    same order, and the percentiles from a count of each squared distance,
+    of which a grid has few. Only the per-tick series grows with ticks.
+    """
+    # Squared distances buffered before they are merged into the counts.
+    MERGE_EVERY = 1 << 16
+
+    def __init__(self):
+        self.total = 0.0
+        self.total_squared = 0.0
+        self.count = 0
+        self.series = []
+        self.squared = np.zeros(0)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.pending = []
+        self.pending_count = 0
+        self.pairs = np.triu_indices(0, 1)
+
+    def feed(self, x, y, alive):
+        """Add one tick from per-attacker x, y and alive sequences."""
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        alive = np.asarray(alive, dtype=bool)
+        if self.pairs[0].size != len(x) * (len(x) - 1) // 2:
+            self.pairs = np.triu_indices(len(x), 1)
+        i, j = self.pairs
+        dx = x[i] - x[j]
+        dy = y[i] - y[j]
+        squared = dx * dx + dy * dy
+        distance = np.sqrt(squared)
+        paired = alive[i] & alive[j]
+        count = int(paired.sum())
+        if not count:
+            self.series.append(None)
+            return
+        self.series.append(float(np.where(paired, distance, 0.0).sum() / count))
+        values = distance[paired]
+        # Prepending the running total keeps cumsum's left-to-right order across ticks.
+        self.total = float(np.cumsum(np.concatenate(([self.total], values)))[-1])
+        self.total_squared = float(np.cumsum(np.concatenate(([self.total_squared], values * values)))[-1])
+        self.count += count
+        self.pending.append(squared[paired])
+        self.pending_count += count
+        if self.pending_count >= self.MERGE_EVERY:
+            self._merge()
+
+    def _merge(self):
+        if not self.pending:
+            return
+        squared, inverse = np.unique(np.concatenate([self.squared] + self.pending), return_inverse=True)
+        weights = np.concatenate([self.counts, np.ones(self.pending_count, dtype=np.int64)])
+        self.squared = squared
+        self.counts = np.bincount(inverse.ravel(), weights, minlength=len(squared)).astype(np.int64)
+        self.pending = []
+        self.pending_count = 0
+
+    def result(self):
+        """The pairwise_spread report for every tick fed so far."""
+        self._merge()
+        percentiles = _percentiles(self.squared, self.counts) if self.count else None
+        return _summary(self.total, self.total_squared, self.count, percentiles, list(self.series))
@@ -0,0 +1,204 @@
+# -------------------------
+# Run-Length Helpers
+# -------------------------
+def delta_encode(values):
+    # [first, delta, count, delta, count, ...] over consecutive differences.
+    encoded = [values[0]]
+    previous = values[0]
+    run_delta, count = None, 0
+    for value in values[1:]:
+        delta = value - previous
+        previous = value
+        if count and delta == run_delta:
+            count += 1
+        else:
+            if count:
+                encoded += [run_delta, count]
+            run_delta, count = delta, 1
+    if count:
+        encoded += [run_delta, count]
+    return encoded
+
+def delta_decode(encoded):
+    value = encoded[0]
+    values = [value]
+    for i in range(1, len(encoded), 2):
+        delta, count = encoded[i], encoded[i + 1]
+        for _ in range(count):
+            value += delta
+            values.append(value)
+    return values
+
+def value_encode(values):
+    # [value, count, value, count, ...]
+    encoded = []
+    for value in values:
+        if encoded and encoded[-2] == value:
+            encoded[-1] += 1
+        else:
+            encoded += [value, 1]
+    return encoded
+
+def value_decode(encoded):
+    values = []
+    for i in range(0, len(encoded), 2):
+        values.extend([encoded[i]] * encoded[i + 1])
+    return values
+
+def encode_grid(grid):
+    # Alternating run lengths of free and wall cells, row-major, starting with free.
+    runs = []
+    current, count = 0, 0
+    for row in grid:
+        for cell in row:
+            if cell == current:
+                count += 1
+            else:
+                runs.append(count)
+                current, count = cell, 1
+    runs.append(count)
+    height = len(grid)
+    return {"width": len(grid[0]) if height else 0, "height": height, "runs": runs}
+
+def decode_grid(data):
+    cells = []
+    for i, run in enumerate(data["runs"]):
+        cells.extend([i % 2] * run)
+    width = data["width"]
+    return [cells[y * width:(y + 1) * width] for y in range(data["height"])]
+
+# -------------------------
+# Compact Trajectory
+# -------------------------
+class Trajectory:
+    """
+    Columnar record of an episode. Each team keeps one list per field per
+    agent; encode() turns positions and scores into delta run-lengths,
+    orientations into value run-lengths and alive flags into change events.
+    The legacy list of per-tick state dicts is rebuilt only on request.
+    """
+    FORMAT = "compact-v1"
+    FIELDS = {
+        "attackers": ("x", "y", "alive", "score", "orientation"),
+        "defenders": ("x", "y", "alive", "orientation"),
+    }
+    DELTA_FIELDS = ("x", "y", "score")
+
+    def __init__(self):
+        self.ticks = []
+        self.ids = {team: None for team in self.FIELDS}
+        self.columns = {team: {field: [] for field in fields} for team, fields in self.FIELDS.items()}
+        self._states = None
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def append(self, state):
+        self.ticks.append(state["tick"])
+        for team, columns in self.columns.items():
+            agents = state[team]
+            if self.ids[team] is None:
+                self.ids[team] = [agent["id"] for agent in agents]
+                for column in columns.values():
+                    column.extend([] for _ in agents)
+            for field, column in columns.items():
+                for series, agent in zip(column, agents):
+                    series.append(agent[field])
+        self._states = None
+
+    @classmethod
+    def from_states(cls, states):
+        trajectory = cls()
+        for state in states:
+            trajectory.append(state)
+        return trajectory
+
+    def encode(self):
+        data = {"format": self.FORMAT, "length": len(self.ticks), "ticks": delta_encode(self.ticks) if self.ticks else []}
+        for team, columns in self.columns.items():
+            encoded = {"id": self.ids[team] or []}
+            for field, column in columns.items():
+                if field == "alive":
+                    continue
+                encode = delta_encode if field in self.DELTA_FIELDS else value_encode
+                encoded[field] = [encode(series) for series in column]
+            alive = columns["alive"]
+            encoded["alive_initial"] = [series[0] for series in alive]
+            encoded["alive_changes"] = [
+                [t, agent]
+                for agent, series in enumerate(alive)
+                for t in range(1, len(series))
+                if series[t] != series[t - 1]
+            ]
+            data[team] = encoded
+        return data
+
+    @classmethod
+    def decode(cls, data):
+        trajectory = cls()
+        length = data["length"]
+        trajectory.ticks = delta_decode(data["ticks"]) if length else []
+        for team, columns in trajectory.columns.items():
+            encoded = data[team]
+            trajectory.ids[team] = list(encoded["id"])
+            for field in cls.FIELDS[team]:
+                if field == "alive":
+                    continue
+                decode = delta_decode if field in cls.DELTA_FIELDS else value_decode
+                columns[field] = [decode(series) for series in encoded[field]]
+            alive = [[flag] * length for flag in encoded["alive_initial"]]
+            for t, agent in sorted(encoded["alive_changes"]):
+                flag = not alive[agent][t - 1]
+                alive[agent][t:] = [flag] * (length - t)
+            columns["alive"] = alive
+        return trajectory
+
+    def _build_states(self, start, stop):
+        teams = {
+            team: [(agent_id, list(zip(*(columns[field][i][start:stop] for field in columns))))
+                   for i, agent_id in enumerate(self.ids[team] or [])]
+            for team, columns in self.columns.items()
+        }
+        fields = {team: tuple(columns) for team, columns in self.columns.items()}
+        return [
+            {"tick": tick, **{
+                team: [{"id": agent_id, **dict(zip(fields[team], rows[t]))} for agent_id, rows in agents]
+                for team, agents in teams.items()
+            }}
+            for t, tick in enumerate(self.ticks[start:stop])
+        ]
+
+    def states(self):
+        """Legacy view: one {"tick", "attackers", "defenders"} dict per recorded tick."""
+        if self._states is None:
+            self._states = self._build_states(0, len(self.ticks))
+        return self._states
+
+    def iter_states(self, size=512):
+        # The legacy view in lists of at most size states, without keeping them all.
+        if self._states is not None:
+            for start in range(0, len(self.ticks), size):
+                yield self._states[start:start + size]
+            return
+        for start in range(0, len(self.ticks), size):
+            yield self._build_states(start, start + size)
+
+def compact_result(result, trajectory=None):
+    """
+    Swap a run_episode result's states and grid for their compact encodings.
+    An already recorded trajectory can be passed in place of result["states"].
+    """
+    if trajectory is None:
+        trajectory = Trajectory.from_states(result["states"])
+    compact = {key: value for key, value in result.items() if key not in ("map", "states")}
+    compact["format"] = Trajectory.FORMAT
+    compact["map"] = encode_grid(result["map"])
+    compact["trajectory"] = trajectory.encode()
+    return compact
+
+def expand_result(compact):
+    """Inverse of compact_result: rebuild the legacy map grid and states list."""
+    result = {key: value for key, value in compact.items() if key not in ("format", "map", "trajectory")}
+    result["map"] = decode_grid(compact["map"])
+    result["states"] = Trajectory.decode(compact["trajectory"]).states()
+    return result
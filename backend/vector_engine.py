@@ -0,0 +1,538 @@
+import math
+
+import numpy as np
+
+from simulation import Simulation, offset_paths
+from array_map import ArrayMap
+
+# Rows follow RLAgent.ACTIONS: up, down, left, right.
+ACTION_DELTAS = np.array([(0, -1), (0, 1), (-1, 0), (1, 0)], dtype=np.int64)
+ACTION_ORIENTATIONS = np.array([math.atan2(dy, dx) for dx, dy in ACTION_DELTAS.tolist()])
+# Attacker x defender counts up to this compare every pair instead of binning.
+NEAR_PAIRS_DENSE_MAX = 1024
+
+# -------------------------
+# Line-of-Sight Table
+# -------------------------
+class LineOfSightTable:
+    """
+    Array form of offset_paths(radius): every offset inside the radius maps
+    to a padded row of relative path cells, so the lines for a whole batch
+    of (source, target) pairs can be checked with one gather.
+    """
+    def __init__(self, game_map, radius):
+        self.radius = radius
+        span = 2 * radius + 1
+        paths = offset_paths(radius)
+        longest = max(len(path) for _, _, path in paths)
+        self.offset_ids = np.full((span, span), -1, dtype=np.intp)
+        self.cells = np.zeros((len(paths), max(longest, 1), 2), dtype=np.intp)
+        self.valid = np.zeros((len(paths), max(longest, 1)), dtype=bool)
+        for k, (dx, dy, path) in enumerate(paths):
+            self.offset_ids[dy + radius, dx + radius] = k
+            if path:
+                self.cells[k, :len(path)] = path
+                self.valid[k, :len(path)] = True
+        # Pad with walls so path cells never need a bounds check.
+        self.free = np.zeros((game_map.height + 2 * radius, game_map.width + 2 * radius), dtype=bool)
+        self.free[radius:radius + game_map.height, radius:radius + game_map.width] = game_map.free_mask
+
+    def clear(self, src, dx, dy):
+        ids = self.offset_ids[dy + self.radius, dx + self.radius]
+        cells = src[:, None, :] + self.cells[ids] + self.radius
+        free = self.free[cells[..., 1], cells[..., 0]]
+        return (free | ~self.valid[ids]).all(axis=1)
+
+def _distinct(envs, targets, count):
+    """True when no two (env, target) pairs repeat."""
+    keys = envs * count + targets
+    return len(np.unique(keys)) == len(keys)
+
+# -------------------------
+# Structure-of-Arrays World State
+# -------------------------
+class ArrayEngine:
+    """
+    Positions, orientations, alive flags, scores and Q-values held in NumPy
+    arrays. Per-agent state has a leading environment axis so independent
+    copies of one layout can be stepped together; Q-values are per agent
+    and shared by all copies, or come from one state-indexed QTable per
+    team when q_tables/state_encoder are given. Each tick resolves visibility for every
+    attacker/defender pair in batched array ops and only walks agents in
+    order where the engagement rules depend on it.
+    """
+    def __init__(self, game_map, attackers, defenders, num_envs=1, max_ticks=1000,
+                 epsilon=0.1, alpha=0.1, gamma=0.9, rng=None, q_tables=None, state_encoder=None):
+        self.map = game_map
+        self.num_envs = num_envs
+        self.max_ticks = max_ticks
+        self.epsilon = epsilon
+        self.alpha = alpha
+        self.gamma = gamma
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        self.a_start = np.array([(a.x, a.y) for a in attackers], dtype=np.int64).reshape(-1, 2)
+        self.d_start = np.array([(d.x, d.y) for d in defenders], dtype=np.int64).reshape(-1, 2)
+        self.a_range = np.array([a.vision_range for a in attackers], dtype=float)
+        self.d_range = np.array([d.vision_range for d in defenders], dtype=float)
+        self.a_angle = np.array([a.view_angle for a in attackers], dtype=float)
+        self.d_angle = np.array([d.view_angle for d in defenders], dtype=float)
+        self.a_reaction = np.array([a.reaction for a in attackers], dtype=float)
+        self.d_reaction = np.array([d.reaction for d in defenders], dtype=float)
+        self.a_q = np.array([[a.q_values[action] for action in a.ACTIONS] for a in attackers], dtype=float).reshape(-1, 4)
+        self.d_q = np.array([[d.q_values[action] for action in d.ACTIONS] for d in defenders], dtype=float).reshape(-1, 4)
+        self.a_table, self.d_table = q_tables if q_tables is not None else (None, None)
+        self.learning = True
+        self.state_encoder = state_encoder
+
+        num_a = len(attackers)
+        num_d = len(defenders)
+        self.a_pos = np.zeros((num_envs, num_a, 2), dtype=np.int64)
+        self.d_pos = np.zeros((num_envs, num_d, 2), dtype=np.int64)
+        self.a_orient = np.tile(np.array([a.orientation for a in attackers], dtype=float), (num_envs, 1))
+        self.d_orient = np.tile(np.array([d.orientation for d in defenders], dtype=float), (num_envs, 1))
+        self.a_alive = np.zeros((num_envs, num_a), dtype=bool)
+        self.d_alive = np.zeros((num_envs, num_d), dtype=bool)
+        self.a_score = np.zeros((num_envs, num_a), dtype=np.int64)
+        # Visited cells as one packed bitset per attacker.
+        self.a_visited = np.zeros((num_envs, num_a, (game_map.width * game_map.height + 7) // 8), dtype=np.uint8)
+        self.active = np.zeros(num_envs, dtype=bool)
+        self.a_reward = np.zeros(num_envs)
+        self.d_reward = np.zeros(num_envs)
+
+        radius = int(math.ceil(max(np.concatenate([self.a_range, self.d_range, [0.0]]))))
+        self.los = LineOfSightTable(game_map, radius)
+        self.reset()
+
+    def reset(self):
+        self.a_pos[:] = self.a_start
+        self.d_pos[:] = self.d_start
+        self.a_alive[:] = True
+        self.d_alive[:] = True
+        self.a_score[:] = 0
+        self.a_visited[:] = 0
+        if len(self.a_start):
+            self._visit(np.repeat(np.arange(self.num_envs), len(self.a_start)),
+                        np.tile(np.arange(len(self.a_start)), self.num_envs),
+                        np.tile(self.a_start, (self.num_envs, 1)))
+        self.active[:] = True
+        self.a_reward[:] = 0
+        self.d_reward[:] = 0
+        self.q_delta = 0.0
+        self.q_updates = 0
+
+    def update_active(self, tick):
+        self.active &= self.a_alive.any(axis=1) & self.d_alive.any(axis=1) & (tick < self.max_ticks)
+        return self.active
+
+    def _visit(self, envs, agents, pos):
+        # Mark cells visited; returns which of them were new.
+        flat = pos[:, 1] * self.map.width + pos[:, 0]
+        byte = flat >> 3
+        bit = (1 << (flat & 7)).astype(np.uint8)
+        is_new = (self.a_visited[envs, agents, byte] & bit) == 0
+        self.a_visited[envs, agents, byte] |= bit
+        return is_new
+
+    def near_pairs(self):
+        """
+        (env, attacker, defender) index arrays for live agents of active
+        environments that may be within range of each other. Small layouts
+        take every pair; larger ones bin defenders into blocks one vision
+        range wide, like SpatialIndex, and match each attacker against the
+        nine blocks around its own.
+        """
+        live_a = self.active[:, None] & self.a_alive
+        live_d = self.active[:, None] & self.d_alive
+        if live_a.shape[1] * live_d.shape[1] <= NEAR_PAIRS_DENSE_MAX:
+            return np.nonzero(live_a[:, :, None] & live_d[:, None, :])
+        a_env, a_id = np.nonzero(live_a)
+        d_env, d_id = np.nonzero(live_d)
+        if not len(a_env) or not len(d_env):
+            return a_env[:0], a_id[:0], d_id[:0]
+        # Blocks are padded by one on every side so neighbour keys never wrap.
+        size = max(1, self.los.radius)
+        cols = self.map.width // size + 3
+        rows = self.map.height // size + 3
+
+        def block_keys(envs, pos):
+            return (envs * rows + pos[:, 1] // size + 1) * cols + pos[:, 0] // size + 1
+
+        d_keys = block_keys(d_env, self.d_pos[d_env, d_id])
+        order = np.argsort(d_keys, kind="stable")
+        d_keys = d_keys[order]
+        near = (np.arange(-1, 2)[:, None] * cols + np.arange(-1, 2)[None, :]).ravel()
+        queries = (block_keys(a_env, self.a_pos[a_env, a_id])[:, None] + near).ravel()
+        start = np.searchsorted(d_keys, queries, side="left")
+        counts = np.searchsorted(d_keys, queries, side="right") - start
+        query = np.repeat(np.arange(len(queries)), counts)
+        found = order[start[query] + np.arange(len(query)) - np.repeat(np.cumsum(counts) - counts, counts)]
+        attacker = query // len(near)
+        return a_env[attacker], a_id[attacker], d_id[found]
+
+    def sightings(self):
+        """
+        Batched Agent.can_see in both directions between live agents of
+        active environments. Only pairs from near_pairs within the viewer's
+        range reach the angle and line-of-sight checks. Returns (see_ad,
+        see_da, distance), with distance indexed like see_ad and infinite
+        for pairs that were never compared.
+        """
+        envs, a_id, d_id = self.near_pairs()
+        dx = self.d_pos[envs, d_id, 0] - self.a_pos[envs, a_id, 0]
+        dy = self.d_pos[envs, d_id, 1] - self.a_pos[envs, a_id, 1]
+        pair_distance = np.sqrt(dx * dx + dy * dy)
+        distance = np.full(self.a_alive.shape + self.d_alive.shape[1:], np.inf)
+        distance[envs, a_id, d_id] = pair_distance
+        see_ad = self.visibility(self.a_pos, self.a_orient, self.a_range, self.a_angle,
+                                 envs, a_id, d_id, dx, dy, pair_distance, distance.shape)
+        see_da = self.visibility(self.d_pos, self.d_orient, self.d_range, self.d_angle,
+                                 envs, d_id, a_id, -dx, -dy, pair_distance,
+                                 distance.shape[:1] + distance.shape[:0:-1])
+        return see_ad, see_da, distance
+
+    def visibility(self, src_pos, src_orient, src_range, src_angle, envs, src, dst, dx, dy, distance,
+                   shape, epsilon=1e-6):
+        """Agent.can_see for the (env, source, target) pairs given their offsets, as a dense mask."""
+        visible = np.zeros(shape, dtype=bool)
+        in_range = distance <= src_range[src]
+        envs, src, dst, dx, dy = envs[in_range], src[in_range], dst[in_range], dx[in_range], dy[in_range]
+        if not len(envs):
+            return visible
+        angle_diff = np.abs((np.arctan2(dy, dx) - src_orient[envs, src] + math.pi) % (2 * math.pi) - math.pi)
+        in_cone = angle_diff <= src_angle[src] + epsilon
+        envs, src, dst = envs[in_cone], src[in_cone], dst[in_cone]
+        if len(envs):
+            visible[envs, src, dst] = self.los.clear(src_pos[envs, src], dx[in_cone], dy[in_cone])
+        return visible
+
+    def choose_actions(self, q_rows):
+        count = len(q_rows)
+        explore = self.rng.random(count) < self.epsilon
+        random_actions = self.rng.integers(0, q_rows.shape[1], count)
+        # Break ties between equal Q-values uniformly at random.
+        best = q_rows == q_rows.max(axis=1, keepdims=True)
+        greedy = np.where(best, self.rng.random(q_rows.shape), -1.0).argmax(axis=1)
+        return np.where(explore, random_actions, greedy)
+
+    def update_q(self, q, agents, actions, rewards):
+        current_q = q[agents, actions]
+        max_future_q = q[agents].max(axis=1)
+        deltas = self.alpha * (rewards + self.gamma * max_future_q - current_q)
+        np.add.at(q, (agents, actions), deltas)
+        return deltas
+
+    def q_rows(self, q, table, pos, orient, envs, agents):
+        # Q-values for the moving agents, and their encoded states in table mode.
+        if table is None:
+            return q[agents], None
+        states = self.state_encoder.encode_batch(pos[envs, agents], orient[envs, agents])
+        return table.lookup(states), states
+
+    def learn(self, q, table, pos, orient, envs, agents, states, actions, rewards):
+        if not self.learning:
+            return
+        if table is None:
+            deltas = self.update_q(q, agents, actions, rewards)
+        else:
+            next_states = self.state_encoder.encode_batch(pos[envs, agents], orient[envs, agents])
+            deltas = table.update_batch(states, actions, rewards, next_states, self.alpha, self.gamma)
+        self.q_delta += float(np.abs(deltas).sum())
+        self.q_updates += len(deltas)
+
+    def step(self, tick, profiler=None):
+        # Phases are timed as in Simulation.update; movement includes Q-updates here.
+        if profiler is not None:
+            profiler.mark()
+        see_ad, see_da, distance = self.sightings()
+        if profiler is not None:
+            profiler.lap("visibility")
+        self.engage(see_ad, see_da, distance)
+        if profiler is not None:
+            profiler.lap("engagement")
+        self.move_attackers(see_ad, tick)
+        self.move_defenders()
+        if profiler is not None:
+            profiler.lap("movement")
+
+    def engage(self, see_ad, see_da, distance):
+        # Sightings only cover live agents in active environments.
+        if not see_ad.any() and not see_da.any():
+            return
+        engaged_a = np.zeros_like(self.a_alive)
+        engaged_d = np.zeros_like(self.d_alive)
+        distance_da = distance.transpose(0, 2, 1)
+
+        # Attackers in id order each fight their nearest visible defender.
+        # Fights resolve independently unless two attackers in one
+        # environment pick the same defender, so only then walk them in order.
+        i, e = np.nonzero(see_ad.any(axis=2).T)
+        if len(e):
+            j = np.where(see_ad[e, i], distance[e, i], np.inf).argmin(axis=1)
+            if _distinct(e, j, self.d_alive.shape[1]):
+                self._fight(e, i, j, see_da, engaged_a, engaged_d)
+            else:
+                for agent in np.unique(i).tolist():
+                    self._attack(agent, see_ad, see_da, distance, engaged_a, engaged_d)
+
+        # Defenders then shoot their nearest visible attacker if it is unaware.
+        candidates = see_da & (self.a_alive & ~engaged_a)[:, None, :] & (self.d_alive & ~engaged_d)[:, :, None]
+        j, e = np.nonzero(candidates.any(axis=2).T)
+        if not len(e):
+            return
+        i = np.where(candidates[e, j], distance_da[e, j], np.inf).argmin(axis=1)
+        if _distinct(e, i, self.a_alive.shape[1]):
+            # Only unaware attackers are shot; mutual sightings already resolved above.
+            unaware = ~see_ad[e, i, j]
+            self._ambush(e[unaware], i[unaware], j[unaware], engaged_a, engaged_d)
+        else:
+            for agent in np.unique(j).tolist():
+                self._defend(agent, see_ad, see_da, distance_da, engaged_a, engaged_d)
+
+    def _fight(self, e, i, j, see_da, engaged_a, engaged_d):
+        # Attacker i against defender j in env e, pairs sorted by attacker then env.
+        # Draws match one uniform(0, a_reaction[i], n) then uniform(0, d_reaction[j])
+        # per attacker, so seeded runs agree with the sequential order.
+        counts = np.bincount(i, minlength=self.a_alive.shape[1])
+        first = np.cumsum(counts) - counts
+        rank = np.arange(len(e)) - first[i]
+        draws = self.rng.random(2 * len(e))
+        a_reaction = self.a_reaction[i] * draws[2 * first[i] + rank]
+        d_reaction = self.d_reaction[j] * draws[2 * first[i] + counts[i] + rank]
+        won = ~see_da[e, j, i] | (a_reaction < d_reaction)
+        self.d_alive[e[won], j[won]] = False
+        self.a_score[e[won], i[won]] += 5
+        self.a_alive[e[~won], i[~won]] = False
+        self.a_score[e[~won], i[~won]] -= 10
+        engaged_a[e, i] = True
+        engaged_d[e, j] = True
+
+    def _attack(self, i, see_ad, see_da, distance, engaged_a, engaged_d):
+        candidates = see_ad[:, i, :] & self.d_alive & ~engaged_d
+        fighting = self.a_alive[:, i] & ~engaged_a[:, i] & candidates.any(axis=1)
+        if not fighting.any():
+            return
+        e = np.nonzero(fighting)[0]
+        j = np.where(candidates, distance[:, i, :], np.inf).argmin(axis=1)[fighting]
+        self._fight(e, np.full(len(e), i), j, see_da, engaged_a, engaged_d)
+
+    def _ambush(self, e, i, j, engaged_a, engaged_d):
+        self.a_alive[e, i] = False
+        self.a_score[e, i] -= 10
+        engaged_a[e, i] = True
+        engaged_d[e, j] = True
+
+    def _defend(self, j, see_ad, see_da, distance_da, engaged_a, engaged_d):
+        candidates = see_da[:, j, :] & self.a_alive & ~engaged_a
+        fighting = self.d_alive[:, j] & ~engaged_d[:, j] & candidates.any(axis=1)
+        if not fighting.any():
+            return
+        e = np.nonzero(fighting)[0]
+        i = np.where(candidates, distance_da[:, j, :], np.inf).argmin(axis=1)[fighting]
+        unaware = ~see_ad[e, i, j]
+        self._ambush(e[unaware], i[unaware], np.full(int(unaware.sum()), j), engaged_a, engaged_d)
+
+    def move_attackers(self, see_ad, tick):
+        threatened = (see_ad & self.d_alive[:, None, :]).any(axis=2)
+        envs, agents = np.nonzero(self.active[:, None] & self.a_alive & ~threatened)
+        if not len(envs):
+            return
+        q_rows, states = self.q_rows(self.a_q, self.a_table, self.a_pos, self.a_orient, envs, agents)
+        actions = self.choose_actions(q_rows)
+        old = self.a_pos[envs, agents]
+        new = old + ACTION_DELTAS[actions]
+        free = self.map.are_free(new)
+        rewards = np.full(len(envs), -10.0)
+
+        e, i, a, new = envs[free], agents[free], actions[free], new[free]
+        start = self.a_start[i]
+        old_dist = np.abs(old[free] - start).sum(axis=1)
+        new_dist = np.abs(new - start).sum(axis=1)
+        self.a_pos[e, i] = new
+        self.a_orient[e, i] = ACTION_ORIENTATIONS[a]
+        is_new = self._visit(e, i, new)
+        self.a_score[e, i] += is_new
+        # Heavily penalize non-exploration: penalty increases with time.
+        rewards[free] = (new_dist - old_dist) + np.where(is_new, 0.5, -(5 + tick * 0.1))
+        self.learn(self.a_q, self.a_table, self.a_pos, self.a_orient, envs, agents, states, actions, rewards)
+        self.a_reward += np.bincount(envs, rewards, minlength=self.num_envs)
+
+    def move_defenders(self):
+        envs, agents = np.nonzero(self.active[:, None] & self.d_alive)
+        if not len(envs):
+            return
+        q_rows, states = self.q_rows(self.d_q, self.d_table, self.d_pos, self.d_orient, envs, agents)
+        actions = self.choose_actions(q_rows)
+        old = self.d_pos[envs, agents]
+        new = old + ACTION_DELTAS[actions]
+        free = self.map.are_free(new)
+        rewards = np.full(len(envs), -1.0)
+
+        e, i, a, new = envs[free], agents[free], actions[free], new[free]
+        start = self.d_start[i]
+        self.d_pos[e, i] = new
+        self.d_orient[e, i] = ACTION_ORIENTATIONS[a]
+        rewards[free] = np.abs(new - start).sum(axis=1) - np.abs(old[free] - start).sum(axis=1)
+        self.learn(self.d_q, self.d_table, self.d_pos, self.d_orient, envs, agents, states, actions, rewards)
+        self.d_reward += np.bincount(envs, rewards, minlength=self.num_envs)
+
+    def state(self, tick, env=0):
+        a_pos = self.a_pos[env].tolist()
+        d_pos = self.d_pos[env].tolist()
+        return {
+            "tick": tick,
+            "attackers": [
+                {"id": i, "x": x, "y": y, "alive": alive, "score": score, "orientation": orientation}
+                for i, ((x, y), alive, score, orientation) in enumerate(zip(
+                    a_pos, self.a_alive[env].tolist(), self.a_score[env].tolist(), self.a_orient[env].tolist()))
+            ],
+            "defenders": [
+                {"id": i, "x": x, "y": y, "alive": alive, "orientation": orientation}
+                for i, ((x, y), alive, orientation) in enumerate(zip(
+                    d_pos, self.d_alive[env].tolist(), self.d_orient[env].tolist()))
+            ]
+        }
+
+# -------------------------
+# Lockstep Environments
+# -------------------------
+class VectorEnv:
+    """
+    num_envs copies of one engine's layout stepped in lockstep. The copies
+    share the source engine's Q-values (or Q-tables), so every tick makes
+    one batched action selection and one batched Q-update for all of them.
+    Copies that finish early sit idle until the last one is done.
+    """
+    def __init__(self, engine, attackers, defenders, num_envs, rng=None):
+        self.engine = ArrayEngine(engine.map, attackers, defenders, num_envs=num_envs,
+                                  max_ticks=engine.max_ticks, epsilon=engine.epsilon,
+                                  alpha=engine.alpha, gamma=engine.gamma, rng=rng,
+                                  q_tables=(engine.a_table, engine.d_table),
+                                  state_encoder=engine.state_encoder)
+        # Same arrays, not copies: updates from either engine are seen by both.
+        self.engine.a_q = engine.a_q
+        self.engine.d_q = engine.d_q
+        self.num_envs = num_envs
+
+    def run(self, count=None):
+        """
+        Play one episode in the first count copies (default all) and return
+        per-copy ticks, winners and reward totals as arrays.
+        """
+        engine = self.engine
+        count = self.num_envs if count is None else count
+        engine.reset()
+        engine.active[count:] = False
+        ticks = np.zeros(self.num_envs, dtype=np.int64)
+        tick = 0
+        while engine.update_active(tick).any():
+            tick += 1
+            ticks[engine.active] = tick
+            engine.step(tick)
+        return {
+            "ticks": ticks[:count],
+            "attackers_win": ~engine.d_alive[:count].any(axis=1),
+            "attacker_reward": engine.a_reward[:count].copy(),
+            "defender_reward": engine.d_reward[:count].copy(),
+        }
+
+# -------------------------
+# Simulation Backed by the Array Engine
+# -------------------------
+class VectorSimulation(Simulation):
+    """
+    Simulation with the same constructor and result format whose ticks run
+    on an ArrayEngine. The Attacker/Defender objects are only used to seed
+    the arrays and are not updated while episodes run. With num_envs > 1,
+    training-only episodes run num_envs at a time on a VectorEnv.
+
+    Each tick costs a fixed number of NumPy calls, so a single environment
+    with a few dozen agents runs faster on the object engine. This engine
+    pays off with hundreds of agents or with num_envs > 1.
+    """
+    def __init__(self, game_map, attacker_strategy, defender_positions,
+                 attacker_params=None, defender_params=None, max_ticks=1000, num_envs=1, **kwargs):
+        if not isinstance(game_map, ArrayMap):
+            game_map = ArrayMap(game_map.grid, game_map.visibility_max_bytes)
+        # Line of sight and proximity are resolved by the engine's own arrays.
+        kwargs["visibility_index"] = False
+        kwargs["spatial_index"] = False
+        super().__init__(game_map, attacker_strategy, defender_positions,
+                         attacker_params, defender_params, max_ticks, **kwargs)
+        q_tables = None
+        if self.q_state is not None:
+            if not self.shared_q:
+                raise ValueError("The vector engine only supports shared Q-tables (shared_q=True).")
+            q_tables = (self.q_tables["attacker"][0], self.q_tables["defender"][0])
+        self.engine = ArrayEngine(self.map, self.attackers, self.defenders, max_ticks=max_ticks,
+                                  rng=np.random.default_rng(self.rng.getrandbits(64)),
+                                  q_tables=q_tables, state_encoder=self.state_encoder)
+        self.train_batch = max(1, int(num_envs))
+        self.vector_env = None
+        if self.train_batch > 1:
+            self.vector_env = VectorEnv(self.engine, self.attackers, self.defenders, self.train_batch,
+                                        rng=np.random.default_rng(self.rng.getrandbits(64)))
+
+    def attackers_alive(self):
+        return bool(self.engine.a_alive[0].any())
+
+    def defenders_alive(self):
+        return bool(self.engine.d_alive[0].any())
+
+    def get_state(self):
+        return self.engine.state(self.tick)
+
+    def reset_environment(self):
+        self.tick = 0
+        self.engine.reset()
+        self.states = []
+        self.rewards = {"attackers": 0.0, "defenders": 0.0}
+        self.q_delta = 0.0
+        self.q_updates = 0
+
+    def set_learning(self, enabled):
+        super().set_learning(enabled)
+        engines = [self.engine] + ([self.vector_env.engine] if self.vector_env is not None else [])
+        for engine in engines:
+            engine.learning = enabled
+            engine.epsilon = self.epsilon
+
+    def get_q_arrays(self):
+        if self.q_state is not None:
+            return super().get_q_arrays()
+        return {"attacker": [self.engine.a_q], "defender": [self.engine.d_q]}
+
+    def set_q_arrays(self, arrays, copy=True):
+        if self.q_state is not None:
+            return super().set_q_arrays(arrays, copy)
+        # Always in place: the lockstep engine shares these arrays.
+        self.engine.a_q[:] = arrays["attacker"][0]
+        self.engine.d_q[:] = arrays["defender"][0]
+
+    def play_episodes(self, episodes):
+        if self.vector_env is None or len(episodes) == 1:
+            return super().play_episodes(episodes)
+        if self.profiler is not None:
+            self.profiler.begin_episode()
+        batch = self.vector_env.run(len(episodes))
+        if self.profiler is not None:
+            self.profiler.lap("lockstep")
+            self.profiler.end_episode(int(batch["ticks"].sum()), len(episodes))
+        self.rewards = {"attackers": float(batch["attacker_reward"][-1]),
+                        "defenders": float(batch["defender_reward"][-1])}
+        # Q-updates from all copies land in the same values, so the change is per batch.
+        engine = self.vector_env.engine
+        q_delta = engine.q_delta / engine.q_updates if engine.q_updates else 0.0
+        return [
+            {"episode": ep, "ticks": ticks, "attackers_win": win,
+             "attacker_reward": attacker_reward, "defender_reward": defender_reward, "q_delta": q_delta}
+            for ep, ticks, win, attacker_reward, defender_reward in zip(
+                episodes, batch["ticks"].tolist(), batch["attackers_win"].tolist(),
+                batch["attacker_reward"].tolist(), batch["defender_reward"].tolist())
+        ]
+
+    def update(self):
+        self.engine.step(self.tick, self.profiler)
+        self.rewards = {"attackers": float(self.engine.a_reward[0]), "defenders": float(self.engine.d_reward[0])}
+        self.q_delta = self.engine.q_delta
+        self.q_updates = self.engine.q_updates
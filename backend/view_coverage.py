@@ -0,0 +1,101 @@
+import numpy as np
+
+from spread import attacker_columns
+from viewcone import view_cone
+
+# Largest ticks x cells grid cone_coverage marks directly (one byte per entry).
+COVERAGE_MARK_LIMIT = 16 * 1024 * 1024
+
+# -------------------------
+# Line of Sight from the Map's Visibility Index
+# -------------------------
+def visibility_index(game_map, vision_range):
+    """
+    The map's VisibilityIndex covering vision_range, built if needed and
+    subject to the map's visibility_max_bytes.
+    """
+    index = game_map.enable_visibility_index(max(vision_range, 0))
+    if index is None or index.radius < vision_range:
+        raise ValueError("Map is too large for cone coverage at this vision range.")
+    return index
+
+def cone_offsets(index, orientation, vision_range, view_angle):
+    """
+    (dx, dy) and index bit of every offset in the shared view_cone, the
+    agent's own cell left out.
+    """
+    cone = view_cone(orientation, vision_range, view_angle)
+    r = cone.radius
+    if r < 0:
+        return np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.int64)
+    size = cone.span * cone.span
+    bits = np.unpackbits(np.frombuffer(cone.bits.to_bytes((size + 7) // 8, "little"), dtype=np.uint8),
+                         bitorder="little")[:size]
+    dy, dx = np.divmod(np.flatnonzero(bits), cone.span)
+    dx -= r
+    dy -= r
+    keep = (dx != 0) | (dy != 0)
+    dx, dy = dx[keep], dy[keep]
+    return np.stack([dx, dy], axis=1), (dy + index.radius) * index.span + dx + index.radius
+
+# -------------------------
+# Batched Cone Coverage
+# -------------------------
+def cone_coverage(game_map, x, y, orientation, alive, vision_range, view_angle):
+    """
+    Number of distinct cells inside at least one alive attacker's view
+    cone and line of sight, per tick. x, y, orientation and alive are
+    (ticks, attackers) arrays; vision_range and view_angle hold one value
+    per attacker. A cell counts if an attacker standing where it stands
+    could see an agent there.
+    """
+    x = np.asarray(x, dtype=np.int64)
+    y = np.asarray(y, dtype=np.int64)
+    orientation = np.asarray(orientation, dtype=float)
+    alive = np.asarray(alive, dtype=bool)
+    ticks, attackers = x.shape if x.ndim == 2 else (len(x), 0)
+    if ticks == 0 or attackers == 0:
+        return np.zeros(ticks, dtype=np.int64)
+    index = visibility_index(game_map, max(vision_range))
+    rows_bits = np.frombuffer(index.table, dtype=np.uint8).reshape(-1, index.stride)
+    cells = game_map.width * game_map.height
+    inside = alive & (x >= 0) & (x < game_map.width) & (y >= 0) & (y < game_map.height)
+
+    keys = []
+    for a in range(attackers):
+        rows = np.flatnonzero(inside[:, a])
+        if not len(rows):
+            continue
+        # Orientations repeat (four after the first move), so each cone is fetched once.
+        angles, groups = np.unique(orientation[rows, a], return_inverse=True)
+        for g, angle in enumerate(angles.tolist()):
+            offsets, bits = cone_offsets(index, angle, vision_range[a], view_angle[a])
+            if not len(bits):
+                continue
+            t = rows[groups == g]
+            src = y[t, a] * game_map.width + x[t, a]
+            visible = (rows_bits[src[:, None], (bits >> 3)[None, :]] >> (bits & 7)[None, :].astype(np.uint8)) & 1 == 1
+            # Visible offsets are in bounds, so flat cell offsets can be added directly.
+            flat_offsets = offsets[:, 1] * game_map.width + offsets[:, 0]
+            keys.append(((t * cells + src)[:, None] + flat_offsets[None, :])[visible])
+    if not keys:
+        return np.zeros(ticks, dtype=np.int64)
+    keys = np.concatenate(keys)
+    if ticks * cells <= COVERAGE_MARK_LIMIT:
+        # Marking a (tick, cell) grid is much cheaper than a unique() over the keys.
+        marked = np.zeros(ticks * cells, dtype=bool)
+        marked[keys] = True
+        return np.count_nonzero(marked.reshape(ticks, cells), axis=1)
+    unique = np.unique(keys)
+    return np.bincount(unique // cells, minlength=ticks)
+
+def state_coverage(game_map, states, attacker_params):
+    """
+    cone_coverage over a list of state dicts, as a list of per-state
+    counts. attacker_params holds (vision_range, view_angle) per attacker.
+    """
+    columns = attacker_columns(states)
+    vision_range = [params[0] for params in attacker_params]
+    view_angle = [params[1] for params in attacker_params]
+    return cone_coverage(game_map, columns[..., 0], columns[..., 1], columns[..., 2], columns[..., 3],
+                         vision_range, view_angle).tolist()
@@ -0,0 +1,64 @@
+import math
+from collections import OrderedDict
+
+# Upper bound on cached cone masks; arbitrary initial orientations each need one.
+CONE_CACHE_MAX = 4096
+
+# Vision ranges above this are tested with trigonometry instead of a mask.
+CONE_MAX_RADIUS = 32
+
+# Orientation after a unit grid step, exactly as math.atan2 computes it.
+STEP_ORIENTATIONS = {(dx, dy): math.atan2(dy, dx) for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1))}
+
+_CONES = OrderedDict()
+
+def step_orientation(dx, dy):
+    orientation = STEP_ORIENTATIONS.get((dx, dy))
+    return orientation if orientation is not None else math.atan2(dy, dx)
+
+class ViewCone:
+    """
+    Offsets an agent with the given orientation, vision_range and
+    view_angle can see, ignoring walls, as one bit per offset in the
+    (2R+1) x (2R+1) window around it (R = floor(vision_range)). Bits are
+    filled in with the same float arithmetic as Agent.can_see, so the
+    lookup agrees with it exactly, epsilon included.
+    """
+    def __init__(self, orientation, vision_range, view_angle, epsilon=1e-6):
+        self.orientation = orientation
+        self.vision_range = vision_range
+        self.view_angle = view_angle
+        self.epsilon = epsilon
+        self.radius = int(math.floor(vision_range)) if vision_range >= 0 else -1
+        self.span = 2 * self.radius + 1
+        bits = 0
+        for dy in range(-self.radius, self.radius + 1):
+            for dx in range(-self.radius, self.radius + 1):
+                distance = math.sqrt(dx * dx + dy * dy)
+                if distance > vision_range:
+                    continue
+                angle_to_other = math.atan2(dy, dx)
+                angle_diff = abs((angle_to_other - orientation + math.pi) % (2 * math.pi) - math.pi)
+                if angle_diff > view_angle + epsilon:
+                    continue
+                bits |= 1 << ((dy + self.radius) * self.span + dx + self.radius)
+        self.bits = bits
+
+    def contains(self, dx, dy):
+        r = self.radius
+        if not (-r <= dx <= r and -r <= dy <= r):
+            return False
+        return (self.bits >> ((dy + r) * self.span + dx + r)) & 1 == 1
+
+def view_cone(orientation, vision_range, view_angle, epsilon=1e-6):
+    """Shared ViewCone for these parameters, from an LRU cache of CONE_CACHE_MAX entries."""
+    key = (orientation, vision_range, view_angle, epsilon)
+    cone = _CONES.get(key)
+    if cone is None:
+        cone = ViewCone(orientation, vision_range, view_angle, epsilon)
+        _CONES[key] = cone
+        if len(_CONES) > CONE_CACHE_MAX:
+            _CONES.popitem(last=False)
+    else:
+        _CONES.move_to_end(key)
+    return cone
@@ -0,0 +1,37 @@
+"""
+WSGI entry point for serving with worker processes:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+gunicorn.conf.py sets preload_app, so this module is imported once in the
+master before it forks: everything warmed here is shared copy-on-write by
+all workers instead of being rebuilt by each of them on its first request.
+"""
+import json
+import os
+
+from server import app, preload_map
+from simulation import DEFAULT_ATTACKER_PARAMS, DEFAULT_DEFENDER_PARAMS, offset_paths
+from viewcone import STEP_ORIENTATIONS, view_cone
+
+def preload(maps_path=None):
+    """
+    Import the NumPy-backed modules, fill the default-radius offset and
+    view-cone tables, and build visibility indexes for the grids in
+    maps_path (a JSON file holding a list of grids), if any.
+    """
+    import array_map, qtable, spread, vector_engine, view_coverage  # noqa: F401
+    radius = max(DEFAULT_ATTACKER_PARAMS["vision_range"], DEFAULT_DEFENDER_PARAMS["vision_range"])
+    offset_paths(radius)
+    for params in (DEFAULT_ATTACKER_PARAMS, DEFAULT_DEFENDER_PARAMS):
+        for orientation in STEP_ORIENTATIONS.values():
+            view_cone(orientation, params["vision_range"], params["view_angle"])
+    if maps_path:
+        with open(maps_path) as f:
+            grids = json.load(f)
+        radius = int(os.getenv('PRELOAD_VISION_RANGE', radius))
+        for grid in grids:
+            preload_map(grid, radius)
+    return app
+
+preload(os.getenv('PRELOAD_MAPS'))
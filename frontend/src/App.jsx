@@ -707,9 +707,11 @@ function App() {
           <div className="getsim">
             <GetSimulation
               getGrid={processGridState}
-              onSimulationResult={(result) => {
+              onSimulationResult={(result, first) => {
                 setSimulationData(result);
-                setShowSimulation(true);
+                if (first) {
+                  setShowSimulation(true);
+                }
               }}
             />
           </div>
@@ -1,5 +1,9 @@
 import React, { useState } from "react";
 
+// A fixed seed makes repeated runs of the same layout reproducible, which
+// also lets the server answer them from its result cache.
+const SIMULATION_SEED = 0;
+
 function GetSimulation({ getGrid, onSimulationResult }) {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
@@ -21,20 +25,69 @@ function GetSimulation({ getGrid, onSimulationResult }) {
       defender_positions,
       attacker_params,
       defender_params,
+      seed: SIMULATION_SEED,
     };
 
     try {
+      // Ask for NDJSON so playback can start on the first tick while the
+      // server is still simulating the rest of the episode.
       const response = await fetch("http://127.0.0.1:5000/simulate", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          Accept: "application/x-ndjson",
+        },
         body: JSON.stringify(payload),
       });
       if (!response.ok) {
         throw new Error(`Server error: ${response.status}`);
       }
-      const data = await response.json();
-      onSimulationResult(data);
-      console.log(data);
+      const result = { map: null, states: [], outcome: null, stats: null };
+      const handleEvent = (event) => {
+        if (event.type === "map") {
+          result.map = event.map;
+        } else if (event.type === "state") {
+          result.states.push(event.state);
+        } else if (event.type === "result") {
+          result.outcome = event.outcome;
+          result.stats = event.stats;
+        }
+      };
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = "";
+      let published = false;
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (value) {
+          buffered += decoder.decode(value, { stream: true });
+          const lines = buffered.split("\n");
+          buffered = lines.pop();
+          lines.filter((line) => line.trim()).forEach((line) => handleEvent(JSON.parse(line)));
+        }
+        if (done) {
+          if (buffered.trim()) {
+            handleEvent(JSON.parse(buffered));
+          }
+          if (!result.outcome) {
+            result.error = "Simulation stream ended without a result";
+          }
+        }
+        // Publish once per network chunk rather than once per tick. Only the
+        // first publish opens the playback, so closing it mid-stream sticks.
+        if (result.map && result.states.length > 0) {
+          onSimulationResult({ ...result, states: result.states.slice() }, !published);
+          published = true;
+        }
+        if (done) {
+          break;
+        }
+      }
+      if (result.error) {
+        throw new Error(result.error);
+      }
+      console.log(result);
     } catch (err) {
       setError(err.message);
       console.error("Error running simulation:", err);
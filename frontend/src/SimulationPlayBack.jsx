@@ -1,7 +1,13 @@
-import React, { useState } from "react";
+import React, { useMemo, useState } from "react";
 import "./SimulationPlayback.css";
+import { decodeSimulationResult } from "./trajectory";
 
-const SimulationPlayback = ({ simulationData }) => {
+const SimulationPlayback = ({ simulationData: rawSimulationData }) => {
+  // Accept both the legacy result and the compact trajectory format.
+  const simulationData = useMemo(
+    () => decodeSimulationResult(rawSimulationData),
+    [rawSimulationData]
+  );
   const mapData = simulationData.map;
   const gridRows = mapData.length;
   const gridCols = mapData[0].length;
@@ -116,11 +122,19 @@ const SimulationPlayback = ({ simulationData }) => {
         </div>
         <div className="outcome">
           Outcome:{" "}
-          {simulationData.outcome.attackers_win
+          {simulationData.error
+            ? "Incomplete"
+            : !simulationData.outcome
+            ? "Running..."
+            : simulationData.outcome.attackers_win
             ? "Attackers Win"
             : "Defenders Win"}
         </div>
-        <button className="tool-button" onClick={() => setShowStats(true)}>
+        <button
+          className="tool-button"
+          onClick={() => setShowStats(true)}
+          disabled={!simulationData.stats}
+        >
           Show Statistics
         </button>
       </div>
@@ -137,7 +151,7 @@ const SimulationPlayback = ({ simulationData }) => {
         ))}
       </div>
 
-      {showStats && (
+      {showStats && simulationData.stats && (
         <div className="modal-overlay" onClick={() => setShowStats(false)}>
           {renderStatsModal()}
         </div>
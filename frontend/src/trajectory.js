@@ -0,0 +1,88 @@
+// Decoders for the server's "compact-v1" result format (backend/trajectory.py).
+
+const deltaDecode = (encoded) => {
+  let value = encoded[0];
+  const values = [value];
+  for (let i = 1; i < encoded.length; i += 2) {
+    for (let n = 0; n < encoded[i + 1]; n++) {
+      value += encoded[i];
+      values.push(value);
+    }
+  }
+  return values;
+};
+
+const valueDecode = (encoded) => {
+  const values = [];
+  for (let i = 0; i < encoded.length; i += 2) {
+    for (let n = 0; n < encoded[i + 1]; n++) {
+      values.push(encoded[i]);
+    }
+  }
+  return values;
+};
+
+export const decodeGrid = ({ width, height, runs }) => {
+  const cells = [];
+  runs.forEach((run, i) => {
+    for (let n = 0; n < run; n++) {
+      cells.push(i % 2);
+    }
+  });
+  return Array.from({ length: height }, (_, y) =>
+    cells.slice(y * width, (y + 1) * width)
+  );
+};
+
+const decodeTeam = (team, length) => {
+  const columns = {};
+  Object.entries(team).forEach(([field, series]) => {
+    if (field === "id" || field.startsWith("alive")) {
+      return;
+    }
+    const decode = field === "orientation" ? valueDecode : deltaDecode;
+    columns[field] = series.map(decode);
+  });
+  const alive = team.alive_initial.map((flag) => Array(length).fill(flag));
+  [...team.alive_changes]
+    .sort((a, b) => a[0] - b[0])
+    .forEach(([tick, agent]) => {
+      alive[agent].fill(!alive[agent][tick - 1], tick);
+    });
+  columns.alive = alive;
+  return columns;
+};
+
+export const decodeTrajectory = (trajectory) => {
+  const { length } = trajectory;
+  const ticks = length ? deltaDecode(trajectory.ticks) : [];
+  const teams = {};
+  ["attackers", "defenders"].forEach((name) => {
+    teams[name] = decodeTeam(trajectory[name], length);
+  });
+  return ticks.map((tick, t) => {
+    const state = { tick };
+    Object.entries(teams).forEach(([name, columns]) => {
+      state[name] = trajectory[name].id.map((id, i) => {
+        const agent = { id };
+        Object.entries(columns).forEach(([field, series]) => {
+          agent[field] = series[i][t];
+        });
+        return agent;
+      });
+    });
+    return state;
+  });
+};
+
+// Normalise a /simulate result to the legacy { map, states, outcome, stats } shape.
+export const decodeSimulationResult = (result) => {
+  if (result.format !== "compact-v1") {
+    return result;
+  }
+  return {
+    ...result,
+    map: decodeGrid(result.map),
+    states: decodeTrajectory(result.trajectory),
+  };
+};